@@ -0,0 +1,75 @@
+"""
+Batch Matching Benchmark
+เปรียบเทียบความเร็วการจับคู่ใบหน้าทีละใบกับแบบ batch ตามจำนวนใบหน้าในเฟรม
+
+Usage:
+    python benchmarks/bench_batch_matching.py [--gallery 3000] [--repeat 200] [--per-member 1]
+"""
+
+import argparse
+import os
+import queue
+import sys
+import time
+
+import numpy as np
+
+src_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src'))
+if src_path not in sys.path:
+    sys.path.insert(0, src_path)
+
+from core.face_recognition.face_manager import FaceRecognitionManager
+from core.face_recognition.gallery import EMBEDDING_DIM
+
+
+def build_manager(gallery_size, rng, per_member=1):
+    """Create a manager with a synthetic gallery of per_member embeddings each"""
+    manager = FaceRecognitionManager(queue.Queue(maxsize=1), queue.Queue(maxsize=3))
+    known_faces = []
+    for i in range(gallery_size):
+        embeddings = rng.standard_normal((per_member, EMBEDDING_DIM)).astype(np.float32)
+        known_faces.append({
+            "name": f"student_{i}",
+            "member_id": f"M{i:06d}",
+            "embedding": embeddings[0],
+            "embeddings": embeddings,
+            "avatar_image": None
+        })
+    manager.set_known_faces(known_faces)
+    return manager
+
+
+def time_call(func, repeat):
+    """Return mean seconds per call"""
+    func()  # warm up
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-face vs batched gallery matching")
+    parser.add_argument("--gallery", type=int, default=3000, help="number of enrolled members")
+    parser.add_argument("--repeat", type=int, default=200, help="iterations per measurement")
+    parser.add_argument("--per-member", type=int, default=1, help="embeddings per member (max-over-set)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    manager = build_manager(args.gallery, rng, args.per_member)
+
+    print(f"Gallery size: {args.gallery} members x {args.per_member} embeddings x {EMBEDDING_DIM}")
+    print(f"{'faces':>6} {'per-face ms':>12} {'batch ms':>10} {'speedup':>8} {'faces/s (batch)':>16}")
+    for num_faces in (1, 2, 4, 8, 15, 32, 64):
+        probes = rng.standard_normal((num_faces, EMBEDDING_DIM)).astype(np.float32)
+
+        per_face = time_call(lambda: [manager.compare_faces(p) for p in probes], args.repeat)
+        batched = time_call(lambda: manager.compare_faces_batch(probes), args.repeat)
+
+        print(f"{num_faces:>6} {per_face * 1000:>12.3f} {batched * 1000:>10.3f} "
+              f"{per_face / batched:>7.1f}x {num_faces / batched:>16.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Gallery Precision Benchmark
+เปรียบเทียบหน่วยความจำ ความเร็ว และความถูกต้องของ gallery แบบ float32 / float16 / int8
+
+Probes are noisy copies of gallery rows. For each storage dtype the script
+reports embedding memory per 10k members, match latency for one face and
+for a 16-face batch, top-1 agreement with float32 and the largest cosine
+error against float32.
+
+Usage:
+    python benchmarks/bench_gallery_precision.py [--gallery 10000] [--probes 1000]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+src_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src'))
+if src_path not in sys.path:
+    sys.path.insert(0, src_path)
+
+from core.face_recognition.gallery import (
+    FaceGallery, EMBEDDING_DIM, STORAGE_DTYPES, normalize_embeddings
+)
+
+
+def synthetic_embeddings(size, num_clusters, rng):
+    """Embeddings grouped around random cluster centres, like real face spaces"""
+    centers = rng.standard_normal((num_clusters, EMBEDDING_DIM)).astype(np.float32)
+    labels = rng.integers(0, num_clusters, size=size)
+    embeddings = centers[labels] + 0.8 * rng.standard_normal((size, EMBEDDING_DIM)).astype(np.float32)
+    return normalize_embeddings(embeddings)
+
+
+def time_call(func, repeat):
+    """Mean seconds per call"""
+    func()  # warm up
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description="float32 vs float16 vs int8 gallery storage")
+    parser.add_argument("--gallery", type=int, default=10000, help="number of enrolled members")
+    parser.add_argument("--probes", type=int, default=1000)
+    parser.add_argument("--clusters", type=int, default=200, help="synthetic structure in the gallery")
+    parser.add_argument("--noise", type=float, default=0.15, help="per-dimension probe noise")
+    parser.add_argument("--repeat", type=int, default=50, help="iterations per latency measurement")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    embeddings = synthetic_embeddings(args.gallery, args.clusters, rng)
+    names = [f"student_{i}" for i in range(args.gallery)]
+
+    truth_rows = rng.choice(args.gallery, size=args.probes, replace=args.probes > args.gallery)
+    probes = normalize_embeddings(embeddings[truth_rows] + args.noise * rng.standard_normal(
+        (args.probes, EMBEDDING_DIM)).astype(np.float32))
+    batch = probes[:16]
+
+    print(f"Gallery: {args.gallery} x {EMBEDDING_DIM}, probes: {args.probes}")
+    print(f"{'dtype':>8} {'MB/10k':>7} {'1 face ms':>10} {'16 faces ms':>12} "
+          f"{'top-1 agree':>12} {'top-1 acc':>10} {'max cos err':>12}")
+
+    reference_top1 = None
+    reference_scores = None
+    for storage_dtype in STORAGE_DTYPES:
+        gallery = FaceGallery(embeddings, names, names, storage_dtype=storage_dtype)
+        megabytes = gallery.nbytes / len(gallery) * 10000 / (1024 * 1024)
+
+        single = time_call(lambda: gallery.match_batch(probes[:1]), args.repeat)
+        batched = time_call(lambda: gallery.match_batch(batch), args.repeat)
+
+        top1, scores = gallery.match_batch(probes)
+        top1, scores = top1[:, 0], scores[:, 0]
+        if reference_top1 is None:
+            reference_top1, reference_scores = top1, scores
+        agreement = float(np.mean(top1 == reference_top1))
+        accuracy = float(np.mean(top1 == truth_rows))
+        max_error = float(np.max(np.abs(scores - reference_scores)))
+
+        print(f"{storage_dtype:>8} {megabytes:>7.2f} {single * 1000:>10.3f} {batched * 1000:>12.3f} "
+              f"{agreement:>12.4f} {accuracy:>10.4f} {max_error:>12.5f}")
+
+
+if __name__ == "__main__":
+    main()
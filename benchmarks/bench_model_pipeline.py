@@ -0,0 +1,85 @@
+"""
+Model Pipeline Benchmark
+เปรียบเทียบเวลาต่อเฟรมของ FaceAnalysis แบบโหลดทุก model กับแบบ detector + recognizer
+
+Runs face_model.get on the same frame with every bundled model loaded
+(the old behaviour) and with only detection + recognition, each using the
+SessionOptions from the face_recognition config.
+
+Usage:
+    python benchmarks/bench_model_pipeline.py [--model buffalo_l] [--image path.jpg] [--frames 50]
+
+Without --image the InsightFace sample photo "t1" (several faces) is used.
+"""
+
+import argparse
+import os
+import queue
+import sys
+import time
+
+import cv2
+import numpy as np
+
+src_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src'))
+if src_path not in sys.path:
+    sys.path.insert(0, src_path)
+
+from core.face_recognition.face_manager import FaceRecognitionManager
+
+
+def load_frame(image_path):
+    """RGB frame to benchmark on"""
+    if image_path:
+        frame = cv2.imread(image_path)
+        if frame is None:
+            raise SystemExit(f"Cannot read {image_path}")
+    else:
+        from insightface.data import get_image
+        frame = get_image("t1")
+    return np.ascontiguousarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+
+
+def measure(manager, model_name, frame, frames):
+    """Load the model with the manager's config and time face_model.get per frame"""
+    start = time.perf_counter()
+    face_model = FaceRecognitionManager._create_model(model_name, **manager._model_kwargs())
+    load_seconds = time.perf_counter() - start
+
+    face_model.get(frame)  # warm up
+    timings = []
+    for _ in range(frames):
+        start = time.perf_counter()
+        faces = face_model.get(frame)
+        timings.append(time.perf_counter() - start)
+    modules = sorted(face_model.models.keys())
+    return load_seconds, np.array(timings) * 1000, len(faces), modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Full FaceAnalysis vs detector + recognizer")
+    parser.add_argument("--model", default="buffalo_l")
+    parser.add_argument("--image", default=None, help="frame to run on (default: InsightFace sample t1)")
+    parser.add_argument("--frames", type=int, default=50)
+    args = parser.parse_args()
+
+    frame = load_frame(args.image)
+    manager = FaceRecognitionManager(queue.Queue(maxsize=1), queue.Queue(maxsize=3))
+    print(f"Model: {args.model}, frame: {frame.shape[1]}x{frame.shape[0]}, frames: {args.frames}")
+
+    results = {}
+    for label, modules in (("all models", []), ("det + rec", ["detection", "recognition"])):
+        manager.config["model_modules"] = modules
+        results[label] = measure(manager, args.model, frame, args.frames)
+
+    print(f"{'pipeline':>12} {'load s':>7} {'faces':>6} {'mean ms':>8} {'p95 ms':>7}  modules")
+    for label, (load_seconds, timings, num_faces, modules) in results.items():
+        print(f"{label:>12} {load_seconds:>7.2f} {num_faces:>6} {timings.mean():>8.1f} "
+              f"{np.percentile(timings, 95):>7.1f}  {', '.join(modules)}")
+
+    speedup = results["all models"][1].mean() / results["det + rec"][1].mean()
+    print(f"Per-frame speedup: {speedup:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -9,28 +9,104 @@ import json
 # Global API configuration - will be loaded once and used everywhere
 _api_config = None
 
-def _load_api_config():
-    """Load API configuration from settings files"""
-    global _api_config
-    
-    if _api_config is not None:
-        return _api_config
-    
-    # Default configuration
-    default_config = {
-        "base_url": "https://smart-school-uat.belib.app",
-        "api_path": "/api",
-        "timeout": 30,
-        "retry_attempts": 3,
-        "retry_delay": 1.0
-    }
-    
-    # Try to find config files from different locations
+# Face recognition configuration - loaded from the "face_recognition" section
+_face_recognition_config = None
+
+DEFAULT_FACE_RECOGNITION_CONFIG = {
+    # Gallery search backend: "exact" (brute-force) or "ivf" (approximate)
+    "index_backend": "exact",
+    # Galleries smaller than this always use exact search
+    "index_min_gallery_size": 5000,
+    # IVF cells (0 = sqrt of gallery size) and cells scanned per probe
+    "ivf_n_lists": 0,
+    "ivf_n_probe": 8,
+    # Reuse avatar embeddings across runs; "" = ~/.face_attendance/cache
+    "embedding_cache_enabled": True,
+    "cache_dir": "",
+    # Memory-mapped gallery file for instant startup ("float32" or "float16")
+    "gallery_file_enabled": True,
+    "gallery_file_dtype": "float32",
+    # Enrollment worker processes: 0 = single process, -1 = one per core minus one.
+    # Each worker loads its own model, so the pool only starts after this many
+    # avatars missed the embedding cache in one load, and stops when the load ends
+    "enrollment_workers": 0,
+    "enrollment_pool_min_avatars": 16,
+    # Members may own several embeddings; score them by "max" over the set or by "prototype" (mean)
+    "match_aggregation": "max",
+    "embeddings_per_member": 5,
+    # Also embed the mirrored avatar at enrollment (one extra inference per avatar)
+    "enrollment_flip_augment": False,
+    # Add live captures recognized at or above this similarity to the member's set (0 = off)
+    "live_capture_min_similarity": 0,
+    # In-memory gallery precision: "float32", "float16" or "int8" (per-row scaled).
+    # Memory saving only: float16 halves the gallery but matches slower than float32
+    "gallery_storage_dtype": "float32",
+    # InsightFace models to load by taskname: "detection", "recognition", "landmark_2d_106",
+    # "landmark_3d_68", "genderage" (empty = every bundled model)
+    "model_modules": ["detection", "recognition"],
+    # onnxruntime SessionOptions; 0 threads = onnxruntime default
+    "onnx_intra_op_threads": 0,
+    "onnx_inter_op_threads": 0,
+    # "disable", "basic", "extended" or "all"
+    "onnx_graph_optimization": "all",
+    # "sequential" or "parallel"
+    "onnx_execution_mode": "sequential",
+    "onnx_enable_cpu_mem_arena": True,
+    "onnx_enable_mem_pattern": True,
+    # Aligned faces per recognizer call on camera frames (1 = one call per face)
+    "recognition_batch_size": 16,
+    # Track faces between detections; undecided tracks are embedded on every processed
+    # frame until they have track_vote_top_k matches, then every track_reembed_interval seconds
+    "tracking_enabled": True,
+    "track_reembed_interval": 1.0,
+    # Seconds a track survives without a matching detection
+    "track_max_age": 1.5,
+    # A track commits to the member whose best track_vote_top_k similarities average
+    # track_vote_accept or more over a majority of at least track_vote_min_matches
+    # matches, or at once on one match of track_vote_early_accept; only committed
+    # tracks record attendance. track_vote_accept None = the attendance threshold
+    # (70); a higher value also raises the similarity attendance needs.
+    # Committed tracks are embedded again every track_verify_interval seconds
+    # (0 = never) and vote again if the match disagrees
+    "track_verify_interval": 3.0,
+    "track_vote_top_k": 3,
+    "track_vote_min_matches": 2,
+    "track_vote_accept": None,
+    "track_vote_early_accept": 85,
+    # Skip face detection while the scene is static: frames are compared on a
+    # motion_gate_width pixel wide grayscale copy, and motion is at least
+    # motion_min_area of the pixels changing by more than motion_pixel_threshold
+    "motion_gate_enabled": True,
+    "motion_gate_width": 80,
+    "motion_pixel_threshold": 20,
+    "motion_min_area": 0.005,
+    # Full detection rate for this long after motion; a static scene is still
+    # checked every motion_idle_interval seconds
+    "motion_hold_seconds": 2.0,
+    "motion_idle_interval": 5.0,
+    # Seconds between skipped-frame / saved-CPU log lines (0 = only on stop)
+    "motion_report_interval": 300,
+    # Detections per second adapt to the measured detection + recognition time,
+    # keeping the processing thread busy at most detection_target_utilization of
+    # the time, and back off when the previous frame is still queued. The rate is
+    # capped at detection_rate_idle_max while no face is waiting for an identity
+    "detection_rate_min": 1.0,
+    "detection_rate_max": 15.0,
+    "detection_rate_idle_max": 5.0,
+    "detection_rate_initial": 3.0,
+    "detection_target_utilization": 0.8,
+    # Per-camera detection zones, keyed by camera name or RTSP URL ("default" for
+    # the rest): lists of rectangles [x1, y1, x2, y2] or polygons [[x, y], ...] in
+    # frame pixels, or in 0..1 fractions of the frame. Empty = whole frame
+    "detection_zones": {}
+}
+
+def _get_config_paths():
+    """Possible settings.json locations, in priority order"""
     current_file = os.path.abspath(__file__)
     project_root = os.path.dirname(os.path.dirname(current_file))  # Go up to project root
     
-    # Possible config file paths
-    config_paths = [
+    return [
         # Main config
         os.path.join(project_root, 'config', 'settings.json'),
         # Installer config
@@ -39,8 +115,10 @@ def _load_api_config():
         os.path.join(os.path.dirname(current_file), 'settings.json'),
         os.path.join(os.path.dirname(os.path.dirname(current_file)), 'settings.json'),
     ]
-    
-    for config_path in config_paths:
+
+def _read_settings_files():
+    """Yield parsed settings.json contents from every readable config path"""
+    for config_path in _get_config_paths():
         if os.path.exists(config_path):
             try:
                 with open(config_path, 'r', encoding='utf-8') as f:
@@ -73,21 +151,64 @@ def _load_api_config():
                         lines.append(line)
                     clean_content = '\n'.join(lines)
                     
-                    data = json.loads(clean_content)
-                    if 'api' in data:
-                        # Merge with default config
-                        config = default_config.copy()
-                        config.update(data['api'])
-                        _api_config = config
-                        return _api_config
+                    yield json.loads(clean_content)
             except Exception as e:
                 # Silently continue to next config file
                 continue
+
+def _load_api_config():
+    """Load API configuration from settings files"""
+    global _api_config
+    
+    if _api_config is not None:
+        return _api_config
+    
+    # Default configuration
+    default_config = {
+        "base_url": "https://smart-school-uat.belib.app",
+        "api_path": "/api",
+        "timeout": 30,
+        "retry_attempts": 3,
+        "retry_delay": 1.0,
+        # Parallel avatar downloads: total workers and concurrent requests per host
+        "avatar_download_workers": 8,
+        "avatar_per_host_limit": 4,
+        # Local avatar cache revalidated with ETag / Last-Modified ("" = ~/.face_attendance/avatars)
+        "avatar_cache_enabled": True,
+        "avatar_cache_dir": "",
+        "avatar_cache_max_mb": 200,
+        # Students requested per page when streaming the roster
+        "roster_page_size": 500
+    }
+    
+    for data in _read_settings_files():
+        if 'api' in data:
+            # Merge with default config
+            config = default_config.copy()
+            config.update(data['api'])
+            _api_config = config
+            return _api_config
     
     # If no config found, use default
     _api_config = default_config
     return _api_config
 
+def _load_face_recognition_config():
+    """Load face recognition configuration from settings files"""
+    global _face_recognition_config
+    
+    if _face_recognition_config is not None:
+        return _face_recognition_config
+    
+    config = DEFAULT_FACE_RECOGNITION_CONFIG.copy()
+    for data in _read_settings_files():
+        if 'face_recognition' in data:
+            config.update(data['face_recognition'])
+            break
+    
+    _face_recognition_config = config
+    return _face_recognition_config
+
 def get_api_base_url():
     """Get base API URL (base_url + api_path)"""
     config = _load_api_config()
@@ -141,6 +262,32 @@ def get_api_retry_config():
         'delay': config.get('retry_delay', 1.0)
     }
 
+def get_avatar_download_config():
+    """Get avatar download concurrency settings"""
+    config = _load_api_config()
+    return {
+        'workers': config.get('avatar_download_workers', 8),
+        'per_host_limit': config.get('avatar_per_host_limit', 4)
+    }
+
+def get_roster_page_size():
+    """Get page size for streamed roster loading"""
+    config = _load_api_config()
+    return config.get('roster_page_size', 500)
+
+def get_avatar_cache_config():
+    """Get local avatar cache settings"""
+    config = _load_api_config()
+    return {
+        'enabled': config.get('avatar_cache_enabled', True),
+        'cache_dir': config.get('avatar_cache_dir', ''),
+        'max_mb': config.get('avatar_cache_max_mb', 200)
+    }
+
+def get_face_recognition_config():
+    """Get face recognition configuration (copy, safe to modify)"""
+    return _load_face_recognition_config().copy()
+
 # Constants that can be imported
 API_BASE_URL = get_api_base_url()
 API_TIMEOUT = get_api_timeout()
@@ -5,7 +5,14 @@ API Client Module
 
 import requests
 import threading
+import hashlib
+import itertools
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from io import BytesIO
+from urllib.parse import urlparse
+from requests.adapters import HTTPAdapter
+
+from .avatar_cache import AvatarCache
 from PIL import Image
 import sys
 import os
@@ -21,7 +28,8 @@ try:
     config_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..', 'config'))
     if config_path not in sys.path:
         sys.path.insert(0, config_path)
-    from global_config import get_api_base_url, get_api_timeout
+    from global_config import (get_api_base_url, get_api_timeout, get_avatar_download_config,
+                               get_avatar_cache_config, get_roster_page_size)
     
     # Test if config loads properly
     test_url = get_api_base_url()
@@ -34,6 +42,12 @@ except ImportError as e:
     # Ultimate fallback only if everything fails
     def get_api_base_url():
         return "https://smart-school-uat.belib.app/api"
+    def get_avatar_download_config():
+        return {'workers': 8, 'per_host_limit': 4}
+    def get_avatar_cache_config():
+        return {'enabled': True, 'cache_dir': '', 'max_mb': 200}
+    def get_roster_page_size():
+        return 500
     API_TIMEOUT = 30
 
 
@@ -42,6 +56,57 @@ class APIClient:
         # Use centralized config if no API URL provided
         self.api_url = api_url or get_api_base_url()
         self.access_token = access_token
+        
+        # Avatar downloads share one keep-alive connection pool
+        download_config = get_avatar_download_config()
+        self.download_workers = max(1, int(download_config.get('workers', 8)))
+        self.per_host_limit = max(1, int(download_config.get('per_host_limit', 4)))
+        self.session = self._create_session()
+        self._host_slots = {}
+        self._host_slots_lock = threading.Lock()
+        self.avatar_cache = self._create_avatar_cache()
+        self.roster_page_size = max(1, int(get_roster_page_size()))
+        self.roster_total = None
+
+    def _create_avatar_cache(self):
+        """Open the local avatar cache (None if disabled or unusable)"""
+        cache_config = get_avatar_cache_config()
+        if not cache_config.get('enabled', True):
+            return None
+        try:
+            max_bytes = int(cache_config.get('max_mb', 200) * 1024 * 1024)
+            return AvatarCache(cache_config.get('cache_dir') or None, max_bytes)
+        except Exception as e:
+            print(f"Avatar cache unavailable: {e}")
+            return None
+
+    def _create_session(self):
+        """Create a pooled HTTP session sized for the download workers"""
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.download_workers, pool_maxsize=self.download_workers)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def set_download_concurrency(self, workers=None, per_host_limit=None):
+        """Change avatar download concurrency (takes effect on the next fetch)"""
+        if workers:
+            self.download_workers = max(1, int(workers))
+            self.session = self._create_session()
+        if per_host_limit:
+            self.per_host_limit = max(1, int(per_host_limit))
+            with self._host_slots_lock:
+                self._host_slots = {}
+
+    def _host_slot(self, url):
+        """Semaphore limiting concurrent requests to the URL's host"""
+        host = urlparse(url).netloc
+        with self._host_slots_lock:
+            slot = self._host_slots.get(host)
+            if slot is None:
+                slot = threading.BoundedSemaphore(self.per_host_limit)
+                self._host_slots[host] = slot
+            return slot
 
     def fetch_students(self, progress_callback=None):
         """Fetch student data from API with progress callback"""
@@ -65,33 +130,21 @@ class APIClient:
                 print("Invalid API response structure")
                 return []
                 
-            students = []
             user_list = data["results"]["data"]
             total_users = len(user_list)
             
             if progress_callback:
                 progress_callback(f"กำลังโหลดข้อมูลนักเรียน {total_users} คน...", 20)
             
-            for i, user in enumerate(user_list):
-                display_name = user.get("display_name", "")
-                member_id = user.get("member_id", "")
-                avatar_path = user.get("avatar_path", "")
-                
-                # Update progress for avatar loading
-                if progress_callback and total_users > 0:
-                    progress = 20 + int((i / total_users) * 60)  # 20% to 80%
-                    progress_callback(f"กำลังโหลดรูปภาพ: {display_name}", progress)
-                
-                avatar_image = None
-                if avatar_path:
-                    avatar_image = self._load_avatar_image(display_name, avatar_path)
-                        
-                students.append({
-                    "display_name": display_name,
-                    "avatar_path": avatar_path,
-                    "avatar_image": avatar_image,
-                    "member_id": member_id
-                })
+            students = [{
+                "display_name": user.get("display_name", ""),
+                "avatar_path": user.get("avatar_path", ""),
+                "avatar_image": None,
+                "avatar_hash": None,
+                "member_id": user.get("member_id", "")
+            } for user in user_list]
+            
+            self._download_avatars(students, progress_callback)
                 
             if progress_callback:
                 progress_callback(f"โหลดข้อมูลเสร็จสิ้น: {len(students)} คน", 80)
@@ -105,42 +158,223 @@ class APIClient:
             traceback.print_exc()
             return []
 
+    def iter_students(self, progress_callback=None, page_size=None):
+        """Yield students page by page, each with its decoded avatar
+        
+        Only one page of users and avatars is held at a time, so memory does
+        not grow with the roster. Progress runs from 20% to 95% when the API
+        reports a total. Errors are raised to the caller, which can then tell
+        a partial roster from a complete one.
+        
+        If the server ignores the page parameter, or paging ends short of
+        results.total, the rest comes from a single unpaged request; a roster
+        still short of the total after that is raised as incomplete.
+        """
+        url = f"{self.api_url}/users/group/student"
+        headers = {
+            "Authorization": f"Bearer {self.access_token}"
+        }
+        page_size = page_size or self.roster_page_size
+        
+        if progress_callback:
+            progress_callback("กำลังเชื่อมต่อ API...", 0)
+        
+        # Users already yielded, so a fallback request does not repeat them
+        seen = set()
+        progress = {"loaded": 0}
+        
+        def stream(user_list):
+            students = [{
+                "display_name": user.get("display_name", ""),
+                "avatar_path": user.get("avatar_path", ""),
+                "avatar_image": None,
+                "avatar_hash": None,
+                "member_id": user.get("member_id", "")
+            } for user in user_list]
+            seen.update(student["member_id"] for student in students)
+            
+            # Students are handed on as soon as their own avatar has arrived
+            for student in self._iter_avatar_downloads(students):
+                yield student
+                progress["loaded"] += 1
+            
+            if progress_callback:
+                loaded, total_users = progress["loaded"], self.roster_total
+                if total_users:
+                    percent = 20 + int(min(loaded / total_users, 1) * 75)  # 20% to 95%
+                    progress_callback(f"โหลดและประมวลผลแล้ว {loaded}/{total_users} คน", percent)
+                else:
+                    progress_callback(f"โหลดและประมวลผลแล้ว {loaded} คน", 50)
+        
+        page = 1
+        paging_works = True
+        while True:
+            print(f"Fetching students page {page} from: {url}")
+            user_list = self._fetch_roster(url, headers, {"limit": str(page_size), "page": str(page)})
+            if not user_list:
+                break
+            
+            # A server that ignores paging returns users it already sent
+            if page > 1 and user_list[0].get("member_id") in seen:
+                print("Roster API ignored the page parameter")
+                paging_works = False
+                break
+            
+            page_full = len(user_list) >= page_size
+            yield from stream(user_list)
+            del user_list
+            
+            if not page_full:
+                break
+            page += 1
+        
+        # Paging that stops short of the reported total is not trusted either
+        if paging_works and self.roster_total and progress["loaded"] < self.roster_total:
+            print(f"Paged roster returned {progress['loaded']} of {self.roster_total} users")
+            paging_works = False
+        
+        if not paging_works:
+            # The single unpaged request the roster was always fetched with
+            print(f"Fetching the whole roster in one request from: {url}")
+            user_list = self._fetch_roster(url, headers, {"limit": "100000"})
+            remaining = [user for user in user_list if user.get("member_id") not in seen]
+            del user_list
+            for start in range(0, len(remaining), page_size):
+                yield from stream(remaining[start:start + page_size])
+            del remaining
+            
+            if self.roster_total and progress["loaded"] < self.roster_total:
+                # Raised so the caller keeps its gallery and cache instead of evicting the rest
+                raise ValueError(f"Roster incomplete: {progress['loaded']} of {self.roster_total} users")
+        
+        loaded = progress["loaded"]
+        print(f"Total students streamed: {loaded}")
+
+    def _fetch_roster(self, url, headers, params):
+        """One roster request; returns its user list and records results.total"""
+        response = self.session.get(url, headers=headers, params=params, timeout=API_TIMEOUT)
+        response.raise_for_status()
+        data = response.json()
+        
+        if "results" not in data or "data" not in data["results"]:
+            raise ValueError("Invalid API response structure")
+        
+        total_users = data["results"].get("total")
+        self.roster_total = int(total_users) if total_users else None
+        return data["results"]["data"]
+
+    def _download_avatars(self, students, progress_callback=None):
+        """Download avatars concurrently into the student dicts (progress 20% to 80%)"""
+        total_users = len(students)
+        for completed, student in enumerate(self._iter_avatar_downloads(students)):
+            if progress_callback and total_users > 0:
+                progress = 20 + int((completed / total_users) * 60)  # 20% to 80%
+                progress_callback(f"กำลังโหลดรูปภาพ: {student['display_name']}", progress)
+
+    def _iter_avatar_downloads(self, students):
+        """Download avatars concurrently, yielding each student as its avatar completes
+        
+        Students without an avatar_path are yielded first. At most
+        download_workers * 2 downloads are in flight; more are submitted as the
+        caller takes finished ones, so a large page never holds all of its
+        decoded avatars at once. Progress is left to the caller, which runs on
+        a single thread.
+        """
+        pending = []
+        for student in students:
+            if student["avatar_path"]:
+                pending.append(student)
+            else:
+                yield student
+        if not pending:
+            return
+        
+        print(f"Downloading {len(pending)} avatars with {self.download_workers} workers "
+              f"({self.per_host_limit} per host)")
+        hits_before = self.avatar_cache.hits if self.avatar_cache else 0
+        
+        remaining = iter(pending)
+        max_in_flight = self.download_workers * 2
+        futures = {}
+        with ThreadPoolExecutor(max_workers=self.download_workers) as executor:
+            while True:
+                for student in itertools.islice(remaining, max_in_flight - len(futures)):
+                    future = executor.submit(self._load_avatar_image, student["display_name"], student["avatar_path"])
+                    futures[future] = student
+                if not futures:
+                    break
+                
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    student = futures.pop(future)
+                    student["avatar_image"], student["avatar_hash"] = future.result()
+                    yield student
+        
+        if self.avatar_cache:
+            unchanged = self.avatar_cache.hits - hits_before
+            print(f"Avatar cache: {unchanged} of {len(pending)} avatars unchanged")
+            self.avatar_cache.flush()
+
     def _load_avatar_image(self, display_name, avatar_path):
-        """Load avatar image from URL"""
+        """Load avatar image from URL
+        
+        Returns (image, content hash of the downloaded bytes), or (None, None).
+        """
         try:
             print(f"Loading avatar for {display_name} from {avatar_path}")
-            img_response = requests.get(avatar_path, timeout=10)
-            img_response.raise_for_status()
+            cache = self.avatar_cache
+            request_headers = cache.conditional_headers(avatar_path) if cache else {}
+            with self._host_slot(avatar_path):
+                img_response = self.session.get(avatar_path, headers=request_headers, timeout=10)
+            
+            content = None
+            if img_response.status_code == 304 and cache:
+                # Unchanged on the server - serve the stored copy
+                content, content_type = cache.read(avatar_path)
+            if content is None:
+                if img_response.status_code == 304:
+                    # Stored copy vanished; fetch unconditionally
+                    with self._host_slot(avatar_path):
+                        img_response = self.session.get(avatar_path, timeout=10)
+                img_response.raise_for_status()
+                content = img_response.content
+                content_type = img_response.headers.get('content-type', '')
+                if cache and content and content_type.startswith('image/'):
+                    cache.store(
+                        avatar_path, content,
+                        etag=img_response.headers.get('ETag'),
+                        last_modified=img_response.headers.get('Last-Modified'),
+                        content_type=content_type
+                    )
             
             # Check content type
-            content_type = img_response.headers.get('content-type', '')
             if not content_type.startswith('image/'):
                 print(f"Invalid content type for {display_name}: {content_type}")
-                return None
+                return None, None
                 
             # Check file size
-            if len(img_response.content) == 0:
+            if len(content) == 0:
                 print(f"Empty image file for {display_name}")
-                return None
+                return None, None
                 
-            avatar_image = Image.open(BytesIO(img_response.content))
+            avatar_image = Image.open(BytesIO(content))
             
             # Check image format
             if avatar_image.format not in ['JPEG', 'PNG', 'BMP', 'TIFF']:
                 print(f"Unsupported image format for {display_name}: {avatar_image.format}")
-                return None
+                return None, None
             
             # Check image size
             if avatar_image.size[0] == 0 or avatar_image.size[1] == 0:
                 print(f"Invalid image size for {display_name}: {avatar_image.size}")
-                return None
+                return None, None
                 
             print(f"✅ Successfully loaded avatar for {display_name}")
-            return avatar_image
+            return avatar_image, hashlib.sha1(content).hexdigest()
             
         except Exception as e:
             print(f"❌ Failed to load avatar for {display_name}: {e}")
-            return None
+            return None, None
 
     def send_attendance(self, member_id, users_org_id, camera_name):
         """Send attendance data to API"""
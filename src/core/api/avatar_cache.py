@@ -0,0 +1,169 @@
+"""
+Avatar Cache
+เก็บไฟล์รูปโปรไฟล์ไว้ในเครื่องพร้อม ETag / Last-Modified เพื่อดาวน์โหลดเฉพาะรูปที่เปลี่ยน
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+
+
+def get_default_avatar_cache_dir():
+    """Per-user directory for downloaded avatars"""
+    return os.path.join(os.path.expanduser('~'), '.face_attendance', 'avatars')
+
+
+class AvatarCache:
+    """Disk cache of avatar bytes with HTTP validators and LRU size cap
+
+    Thread-safe: download workers call it concurrently. The index is kept in
+    memory and written by flush().
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=200 * 1024 * 1024):
+        self.cache_dir = cache_dir or get_default_avatar_cache_dir()
+        self.max_bytes = max_bytes
+        self.index_file = os.path.join(self.cache_dir, "index.json")
+        self.entries = {}
+        self.total_bytes = 0
+        self.hits = 0
+        self.lock = threading.Lock()
+        self.dirty = False
+        self._load_index()
+
+    def _load_index(self):
+        """Load the cache index, dropping entries whose file has gone missing"""
+        if not os.path.exists(self.index_file):
+            return
+        try:
+            with open(self.index_file, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+            for url, entry in entries.items():
+                if os.path.exists(os.path.join(self.cache_dir, entry["file"])):
+                    self.entries[url] = entry
+                    self.total_bytes += entry.get("size", 0)
+            with self.lock:
+                # The cap may have been lowered since the last run
+                self._evict_locked()
+            print(f"Avatar cache: {len(self.entries)} files, {self.total_bytes / (1024 * 1024):.1f} MB")
+        except Exception as e:
+            print(f"Failed to load avatar cache index: {e}")
+            self.entries = {}
+            self.total_bytes = 0
+
+    @staticmethod
+    def _file_name(url):
+        return hashlib.sha1(url.encode('utf-8')).hexdigest() + ".bin"
+
+    def conditional_headers(self, url):
+        """If-None-Match / If-Modified-Since headers for a cached URL"""
+        with self.lock:
+            entry = self.entries.get(url)
+            if entry is None:
+                return {}
+            headers = {}
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+            return headers
+
+    def read(self, url):
+        """Return (content, content_type) of a cached URL, or (None, None)"""
+        with self.lock:
+            entry = self.entries.get(url)
+            if entry is None:
+                return None, None
+            entry["last_access"] = time.time()
+            self.dirty = True
+            path = os.path.join(self.cache_dir, entry["file"])
+            content_type = entry.get("content_type", "")
+
+        try:
+            with open(path, 'rb') as f:
+                content = f.read()
+            with self.lock:
+                self.hits += 1
+            return content, content_type
+        except OSError as e:
+            print(f"Cached avatar unreadable, will re-download: {e}")
+            self.remove(url)
+            return None, None
+
+    def store(self, url, content, etag=None, last_modified=None, content_type=""):
+        """Save downloaded bytes and their validators, then enforce the size cap"""
+        if not etag and not last_modified:
+            # Without validators a cached copy could never be revalidated
+            return
+
+        file_name = self._file_name(url)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            temp_path = os.path.join(self.cache_dir, file_name + f".{threading.get_ident()}.tmp")
+            with open(temp_path, 'wb') as f:
+                f.write(content)
+            os.replace(temp_path, os.path.join(self.cache_dir, file_name))
+        except OSError as e:
+            print(f"Failed to cache avatar: {e}")
+            return
+
+        with self.lock:
+            previous = self.entries.get(url)
+            if previous:
+                self.total_bytes -= previous.get("size", 0)
+            self.entries[url] = {
+                "file": file_name,
+                "etag": etag,
+                "last_modified": last_modified,
+                "content_type": content_type,
+                "size": len(content),
+                "last_access": time.time()
+            }
+            self.total_bytes += len(content)
+            self.dirty = True
+            self._evict_locked()
+
+    def remove(self, url):
+        """Forget a cached URL and delete its file"""
+        with self.lock:
+            self._remove_locked(url)
+
+    def _remove_locked(self, url):
+        entry = self.entries.pop(url, None)
+        if entry is None:
+            return
+        self.total_bytes -= entry.get("size", 0)
+        self.dirty = True
+        try:
+            os.remove(os.path.join(self.cache_dir, entry["file"]))
+        except OSError:
+            pass
+
+    def _evict_locked(self):
+        """Drop least recently used files until the cache fits in max_bytes"""
+        if self.total_bytes <= self.max_bytes:
+            return
+        by_age = sorted(self.entries.items(), key=lambda item: item[1].get("last_access", 0))
+        for url, _ in by_age:
+            if self.total_bytes <= self.max_bytes:
+                break
+            self._remove_locked(url)
+
+    def flush(self):
+        """Write the index to disk"""
+        with self.lock:
+            if not self.dirty:
+                return
+            entries = dict(self.entries)
+            self.dirty = False
+
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            temp_path = self.index_file + ".tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(entries, f)
+            os.replace(temp_path, self.index_file)
+        except Exception as e:
+            print(f"Failed to save avatar cache index: {e}")
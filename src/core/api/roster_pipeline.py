@@ -0,0 +1,105 @@
+"""
+Roster Pipeline
+ดาวน์โหลดรูปนักเรียนและประมวลผลใบหน้าไปพร้อมกันแบบ producer/consumer
+"""
+
+import queue
+import threading
+
+
+_DONE = object()
+
+
+class _ProducerError:
+    def __init__(self, error):
+        self.error = error
+
+
+class RosterPipeline:
+    """Iterable of students whose avatars are downloaded on a background thread
+
+    A producer thread walks APIClient.iter_students (paging + parallel
+    downloads) and feeds decoded students into a bounded queue. The consumer
+    (usually FaceRecognitionManager.load_known_faces) iterates this object on
+    its own thread, so avatar download and embedding extraction overlap.
+    At most queue_size decoded avatars wait in the queue, plus the
+    download_workers * 2 downloads the producer keeps in flight.
+
+    Progress covers both stages: 20% to 98% split evenly between avatars
+    downloaded and students handed to enrollment.
+    """
+
+    def __init__(self, api_client, progress_callback=None, queue_size=64):
+        self.api_client = api_client
+        self.progress_callback = progress_callback
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.downloaded = 0
+        self.enrolled = 0
+        self._stopped = threading.Event()
+        self._producer = None
+
+    def __iter__(self):
+        self._stopped.clear()
+        self._producer = threading.Thread(target=self._produce, daemon=True)
+        self._producer.start()
+
+        if self.progress_callback:
+            self.progress_callback("กำลังเชื่อมต่อ API...", 0)
+
+        try:
+            while True:
+                item = self.queue.get()
+                if item is _DONE:
+                    break
+                if isinstance(item, _ProducerError):
+                    raise item.error
+
+                self._report_progress(item["display_name"])
+                yield item
+                self.enrolled += 1
+        finally:
+            # Unblock the producer if the consumer stopped early
+            self._stopped.set()
+
+        self._report_progress(None)
+        print(f"Roster pipeline finished: {self.downloaded} downloaded, {self.enrolled} enrolled")
+
+    def _produce(self):
+        """Producer thread: page through the roster and queue each decoded student"""
+        try:
+            for student in self.api_client.iter_students():
+                self.downloaded += 1
+                if not self._put(student):
+                    return
+        except Exception as e:
+            print(f"Roster download failed: {e}")
+            self._put(_ProducerError(e))
+            return
+        self._put(_DONE)
+
+    def _put(self, item):
+        """Blocking put that gives up once the consumer has stopped"""
+        while not self._stopped.is_set():
+            try:
+                self.queue.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _report_progress(self, name):
+        """Report combined download/enrollment progress from the consumer thread"""
+        if not self.progress_callback:
+            return
+
+        total = self.api_client.roster_total
+        status = f"ดาวน์โหลด {self.downloaded} · ประมวลผล {self.enrolled}"
+        if total:
+            status = f"ดาวน์โหลด {self.downloaded}/{total} · ประมวลผล {self.enrolled}/{total}"
+            done = min((self.downloaded + self.enrolled) / (2 * total), 1)
+            progress = 20 + int(done * 78)  # 20% to 98%
+        else:
+            progress = 50
+        if name:
+            status += f": {name}"
+        self.progress_callback(status, progress)
@@ -56,6 +56,10 @@ class AttendanceManager:
                 # Find original image
                 known_face = face_manager.get_known_face_by_member_id(member_id)
                 original_image = known_face["avatar_image"] if known_face else None
+                
+                # Matched from the saved gallery before avatars were downloaded
+                if known_face is None:
+                    original_image = face_pil
 
                 if original_image:
                     attendance_data = {
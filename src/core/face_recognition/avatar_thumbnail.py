@@ -0,0 +1,46 @@
+"""
+Avatar Thumbnail
+เก็บรูปโปรไฟล์เป็น JPEG ขนาดการ์ดรายชื่อ (100x130) แล้วถอดรหัสเมื่อแสดงผลเท่านั้น
+"""
+
+from io import BytesIO
+from PIL import Image
+
+
+# Same size as the avatar on an AttendanceList card
+AVATAR_CARD_SIZE = (100, 130)
+THUMBNAIL_JPEG_QUALITY = 85
+
+
+class AvatarThumbnail:
+    """Card-sized avatar kept as encoded JPEG bytes (a few KB per member)
+
+    The gallery holds one per member for its whole lifetime, so only the
+    bytes stay resident; to_image() decodes a PIL image when a card is drawn.
+    """
+
+    __slots__ = ("data", "size")
+
+    def __init__(self, data, size=AVATAR_CARD_SIZE):
+        self.data = data
+        self.size = size
+
+    @classmethod
+    def from_image(cls, avatar_image, size=AVATAR_CARD_SIZE):
+        """Resize an avatar to the card (the card stretches it the same way) and encode it"""
+        card = avatar_image.convert("RGB").resize(size, Image.LANCZOS)
+        buffer = BytesIO()
+        card.save(buffer, format="JPEG", quality=THUMBNAIL_JPEG_QUALITY, optimize=True)
+        return cls(buffer.getvalue(), size)
+
+    def to_image(self):
+        """Decode to a new RGB PIL image"""
+        image = Image.open(BytesIO(self.data))
+        image.load()
+        return image
+
+    def __len__(self):
+        return len(self.data)
+
+    def __bool__(self):
+        return bool(self.data)
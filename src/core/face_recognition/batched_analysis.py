@@ -0,0 +1,161 @@
+"""
+Batched Face Analysis
+ตรวจจับใบหน้าแล้วสกัด embedding ของทุกใบหน้าในเฟรมด้วยการเรียก recognizer ครั้งเดียวต่อ batch
+"""
+
+import math
+import numpy as np
+
+from .face_tracker import box_iou
+
+try:
+    from insightface.app.common import Face
+    from insightface.utils import face_align
+    INSIGHTFACE_AVAILABLE = True
+except ImportError:
+    INSIGHTFACE_AVAILABLE = False
+
+
+def supports_batching(face_model):
+    """True for an InsightFace FaceAnalysis with a detector and a recognizer"""
+    return (INSIGHTFACE_AVAILABLE
+            and getattr(face_model, "det_model", None) is not None
+            and "recognition" in getattr(face_model, "models", {}))
+
+
+def get_faces(face_model, img, max_batch_size=16, regions=None):
+    """Drop-in for FaceAnalysis.get that batches the recognizer
+
+    FaceAnalysis.get aligns each detected face and runs the recognizer on
+    it separately. Here the aligned crops of the frame are stacked into
+    batches of up to max_batch_size for one session run each. Other heads
+    (if loaded) still run per face. max_batch_size <= 1, or a model that is
+    not a FaceAnalysis, falls back to face_model.get.
+
+    regions, if given, limits detection to those DetectionRegions of img
+    (see detect_faces); face coordinates are still in img pixels.
+    """
+    if max_batch_size <= 1 or not supports_batching(face_model):
+        if regions is None:
+            return face_model.get(img)
+        faces = []
+        for region in regions:
+            crop = np.ascontiguousarray(img[region.y1:region.y2, region.x1:region.x2])
+            for face in face_model.get(crop):
+                _offset_face(face, region.x1, region.y1)
+                faces.append(face)
+        return _dedupe_faces(_faces_in_regions(faces, regions))
+
+    faces = detect_faces(face_model, img, regions)
+    embed_faces(face_model, img, faces, max_batch_size)
+    return faces
+
+
+def detect_faces(face_model, img, regions=None):
+    """Detector (and any extra heads) only; the faces come back without embeddings
+
+    With regions, the detector runs once per region crop. When the detector
+    accepts any input size, each crop keeps the full frame's detector scale,
+    so its input shrinks with the crop instead of being stretched to
+    det_size. Boxes and landmarks are mapped back to img pixels, faces whose
+    centre is outside their region's polygon are dropped, and faces found
+    in two overlapping regions are kept once.
+    """
+    if regions is None:
+        faces = _detect(face_model.det_model, img)
+    else:
+        faces = []
+        frame_scale = _detector_scale(face_model.det_model, img.shape[1], img.shape[0])
+        for region in regions:
+            crop = np.ascontiguousarray(img[region.y1:region.y2, region.x1:region.x2])
+            input_size = None
+            if frame_scale is not None:
+                input_size = _crop_input_size(face_model.det_model, region, frame_scale)
+            for face in _detect(face_model.det_model, crop, input_size):
+                _offset_face(face, region.x1, region.y1)
+                faces.append(face)
+        faces = _dedupe_faces(_faces_in_regions(faces, regions))
+    if not faces:
+        return []
+
+    for taskname, model in face_model.models.items():
+        if taskname in ('detection', 'recognition'):
+            continue
+        for face in faces:
+            model.get(img, face)
+    return faces
+
+
+def _detect(det_model, img, input_size=None):
+    bboxes, kpss = det_model.detect(img, input_size=input_size, max_num=0, metric='default')
+    faces = []
+    for i in range(bboxes.shape[0]):
+        kps = kpss[i] if kpss is not None else None
+        faces.append(Face(bbox=bboxes[i, 0:4], kps=kps, det_score=bboxes[i, 4]))
+    return faces
+
+
+def _detector_scale(det_model, width, height):
+    """Scale the detector applies to a full frame, or None for a fixed-size detector"""
+    session = getattr(det_model, "session", None)
+    input_size = getattr(det_model, "input_size", None)
+    if session is None or input_size is None or not isinstance(session.get_inputs()[0].shape[2], str):
+        return None
+    return min(input_size[0] / width, input_size[1] / height)
+
+
+def _crop_input_size(det_model, region, frame_scale):
+    """Detector input for a crop at the full frame's scale, in multiples of 32"""
+    max_width, max_height = det_model.input_size
+    width = min(max_width, max(32, math.ceil(region.width * frame_scale / 32) * 32))
+    height = min(max_height, max(32, math.ceil(region.height * frame_scale / 32) * 32))
+    return (width, height)
+
+
+def _offset_face(face, x, y):
+    """Move a face detected in a crop into frame coordinates"""
+    face.bbox = face.bbox + np.array([x, y, x, y], dtype=face.bbox.dtype)
+    if getattr(face, "kps", None) is not None:
+        face.kps = face.kps + np.array([x, y], dtype=face.kps.dtype)
+
+
+def _faces_in_regions(faces, regions):
+    """Faces whose box centre lies inside at least one region"""
+    kept = []
+    for face in faces:
+        centre_x = (face.bbox[0] + face.bbox[2]) / 2
+        centre_y = (face.bbox[1] + face.bbox[3]) / 2
+        if any(region.contains(centre_x, centre_y) for region in regions):
+            kept.append(face)
+    return kept
+
+
+def _dedupe_faces(faces, iou_threshold=0.5):
+    """Drop lower-scoring duplicates of faces detected in overlapping regions"""
+    if len(faces) < 2:
+        return faces
+    faces = sorted(faces, key=lambda face: -float(getattr(face, "det_score", 0) or 0))
+    kept = []
+    for face in faces:
+        if kept and box_iou(face.bbox[:4], [other.bbox[:4] for other in kept]).max() > iou_threshold:
+            continue
+        kept.append(face)
+    return kept
+
+
+def embed_faces(face_model, img, faces, max_batch_size=16):
+    """Set face.embedding for the given detected faces with batched recognizer calls"""
+    recognizer = face_model.models['recognition']
+    image_size = recognizer.input_size[0]
+    aligned = [
+        (face, face_align.norm_crop(img, landmark=face.kps, image_size=image_size))
+        for face in faces if face.kps is not None
+    ]
+    if not aligned:
+        return
+    max_batch_size = max(1, max_batch_size)
+    for start in range(0, len(aligned), max_batch_size):
+        batch = aligned[start:start + max_batch_size]
+        features = recognizer.get_feat([crop for _, crop in batch])
+        for (face, _), feature in zip(batch, features):
+            face.embedding = feature.flatten()
@@ -0,0 +1,114 @@
+"""
+Detection Zones
+กำหนดพื้นที่ตรวจจับใบหน้า (สี่เหลี่ยมหรือรูปหลายเหลี่ยม) ของแต่ละกล้อง เพื่อตรวจจับเฉพาะบริเวณที่มีใบหน้าได้จริง
+
+Zones come from the detection_zones config, keyed by camera name or RTSP
+URL, with "default" for any other camera. A zone is a rectangle
+[x1, y1, x2, y2] or a polygon [[x, y], ...]. Coordinates that all lie
+within 0..1 are fractions of the frame; otherwise they are pixels of the
+full-resolution camera frame. The detector runs on the bounding rectangle
+of each zone; for polygons, faces whose centre falls outside are dropped.
+"""
+
+import numpy as np
+import cv2
+
+
+def parse_zone(zone):
+    """(N, 2) polygon points of a rectangle or polygon zone, or None if invalid"""
+    try:
+        points = np.asarray(zone, dtype=np.float32)
+    except (TypeError, ValueError):
+        return None
+    if points.shape == (4,):
+        x1, y1, x2, y2 = points
+        points = np.array([[x1, y1], [x2, y1], [x2, y2], [x1, y2]], dtype=np.float32)
+    if points.ndim != 2 or points.shape[1] != 2 or len(points) < 3:
+        return None
+    return points
+
+
+class DetectionZone:
+    """One zone; is_rectangle zones skip the per-face polygon test"""
+
+    def __init__(self, points):
+        self.points = points
+        self.normalized = bool(np.all((points >= 0) & (points <= 1)))
+        x_values, y_values = np.unique(points[:, 0]), np.unique(points[:, 1])
+        self.is_rectangle = len(points) == 4 and len(x_values) == 2 and len(y_values) == 2
+
+    def to_frame(self, width, height, scale=(1.0, 1.0)):
+        """Polygon in pixels of a frame that is the camera frame divided by scale"""
+        if self.normalized:
+            return self.points * np.array([width, height], dtype=np.float32)
+        return self.points / np.array(scale, dtype=np.float32)
+
+
+class DetectionRegion:
+    """A zone resolved for one frame size: crop rectangle and optional polygon"""
+
+    __slots__ = ("x1", "y1", "x2", "y2", "polygon")
+
+    def __init__(self, x1, y1, x2, y2, polygon=None):
+        self.x1, self.y1, self.x2, self.y2 = x1, y1, x2, y2
+        self.polygon = polygon
+
+    @property
+    def width(self):
+        return self.x2 - self.x1
+
+    @property
+    def height(self):
+        return self.y2 - self.y1
+
+    def contains(self, x, y):
+        if not (self.x1 <= x <= self.x2 and self.y1 <= y <= self.y2):
+            return False
+        if self.polygon is None:
+            return True
+        return cv2.pointPolygonTest(self.polygon, (float(x), float(y)), False) >= 0
+
+
+class DetectionZones:
+    """Zones of one camera, resolved and cached per frame size"""
+
+    def __init__(self, zones, min_size=32):
+        self.zones = [DetectionZone(points) for points in map(parse_zone, zones) if points is not None]
+        self.min_size = min_size
+        self._cache = {}
+
+    @classmethod
+    def from_config(cls, zones_config, camera_name=None, rtsp_url=None):
+        """Zones configured for this camera, or None to detect on the whole frame"""
+        if not zones_config:
+            return None
+        for key in (camera_name, rtsp_url, "default"):
+            if key and key in zones_config:
+                zones = cls(zones_config[key])
+                if not zones.zones:
+                    print(f"Detection zones for '{key}' are invalid, using the whole frame")
+                    return None
+                return zones
+        return None
+
+    def __len__(self):
+        return len(self.zones)
+
+    def regions(self, width, height, scale=(1.0, 1.0)):
+        """DetectionRegions of a width x height frame, clipped to it"""
+        key = (width, height, tuple(scale))
+        regions = self._cache.get(key)
+        if regions is not None:
+            return regions
+
+        regions = []
+        for zone in self.zones:
+            polygon = zone.to_frame(width, height, scale)
+            x1, y1 = (max(0, int(v)) for v in np.floor(polygon.min(axis=0)))
+            x2, y2 = (int(v) for v in np.ceil(polygon.max(axis=0)))
+            x2, y2 = min(width, x2), min(height, y2)
+            if x2 - x1 < self.min_size or y2 - y1 < self.min_size:
+                continue
+            regions.append(DetectionRegion(x1, y1, x2, y2, None if zone.is_rectangle else polygon))
+        self._cache[key] = regions
+        return regions
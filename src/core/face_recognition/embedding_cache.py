@@ -0,0 +1,132 @@
+"""
+Embedding Cache
+เก็บ embedding ของรูปโปรไฟล์ลงดิสก์ เพื่อไม่ต้องประมวลผลรูปเดิมซ้ำทุกครั้งที่เปิดโปรแกรม
+"""
+
+import os
+import hashlib
+import numpy as np
+
+
+def get_default_cache_dir():
+    """Per-user cache directory for face data"""
+    return os.path.join(os.path.expanduser('~'), '.face_attendance', 'cache')
+
+
+def avatar_fingerprint(student):
+    """Fingerprint of a student's avatar, preferring the hash of the downloaded bytes"""
+    avatar_hash = student.get("avatar_hash")
+    if avatar_hash:
+        return avatar_hash
+
+    avatar_image = student.get("avatar_image")
+    if avatar_image is None or not hasattr(avatar_image, 'tobytes'):
+        return None
+
+    # Fall back to hashing decoded pixels when the original bytes are unknown
+    digest = hashlib.sha1(f"{avatar_image.mode}:{avatar_image.size}".encode())
+    digest.update(avatar_image.tobytes())
+    return digest.hexdigest()
+
+
+class EmbeddingCache:
+    """On-disk member_id -> (avatar fingerprint, embeddings) store for one model
+
+    Each member maps to the (K, 512) set extracted from its avatar (K > 1
+    with flip augmentation). Sets are saved as one stacked array plus a
+    per-member row count.
+    """
+
+    def __init__(self, cache_dir, model_name):
+        self.cache_dir = cache_dir or get_default_cache_dir()
+        self.model_name = model_name or "unknown"
+        self.cache_file = os.path.join(self.cache_dir, f"embeddings_{self.model_name}.npz")
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self.dirty = False
+
+    def load(self):
+        """Load cached embeddings from disk (missing or corrupt files start empty)"""
+        self.entries = {}
+        if not os.path.exists(self.cache_file):
+            return self
+
+        try:
+            with np.load(self.cache_file, allow_pickle=False) as data:
+                if str(data["model_name"]) != self.model_name:
+                    print(f"Embedding cache model mismatch, ignoring {self.cache_file}")
+                    return self
+                embeddings = data["embeddings"]
+                if "counts" in data.files:
+                    counts = data["counts"]
+                else:
+                    # Files written before embedding sets hold one row per member
+                    counts = np.ones(len(data["member_ids"]), dtype=np.int64)
+                starts = np.concatenate([[0], np.cumsum(counts)])
+                for i, (member_id, fingerprint) in enumerate(zip(data["member_ids"], data["fingerprints"])):
+                    embedding_set = embeddings[starts[i]:starts[i + 1]].copy()
+                    self.entries[str(member_id)] = (str(fingerprint), embedding_set)
+            print(f"Loaded {len(self.entries)} cached embeddings from {self.cache_file}")
+        except Exception as e:
+            print(f"Failed to load embedding cache: {e}")
+            self.entries = {}
+        return self
+
+    def get(self, member_id, fingerprint):
+        """Return the cached (K, 512) embedding set if the avatar is unchanged, else None"""
+        entry = self.entries.get(str(member_id))
+        if entry is not None and fingerprint and entry[0] == fingerprint:
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        return None
+
+    def put(self, member_id, fingerprint, embeddings):
+        """Store the embedding set computed for the member's current avatar"""
+        if not fingerprint:
+            return
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        self.entries[str(member_id)] = (fingerprint, embeddings.reshape(-1, embeddings.shape[-1]))
+        self.dirty = True
+
+    def evict_missing(self, active_member_ids):
+        """Drop members that are no longer in the roster"""
+        active = set(str(member_id) for member_id in active_member_ids)
+        stale = [member_id for member_id in self.entries if member_id not in active]
+        for member_id in stale:
+            del self.entries[member_id]
+        if stale:
+            self.dirty = True
+        return len(stale)
+
+    def save(self):
+        """Write the cache atomically so a crash never leaves a half-written file"""
+        if not self.dirty:
+            return
+
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            member_ids = list(self.entries.keys())
+            fingerprints = [self.entries[member_id][0] for member_id in member_ids]
+            counts = [len(self.entries[member_id][1]) for member_id in member_ids]
+            if member_ids:
+                embeddings = np.concatenate([self.entries[member_id][1] for member_id in member_ids])
+            else:
+                embeddings = np.zeros((0, 0), dtype=np.float32)
+
+            temp_file = self.cache_file + ".tmp"
+            with open(temp_file, 'wb') as f:
+                np.savez(
+                    f,
+                    model_name=np.array(self.model_name),
+                    member_ids=np.array(member_ids, dtype=str),
+                    fingerprints=np.array(fingerprints, dtype=str),
+                    embeddings=embeddings.astype(np.float32),
+                    counts=np.array(counts, dtype=np.int64)
+                )
+            os.replace(temp_file, self.cache_file)
+            self.dirty = False
+            print(f"Saved {len(member_ids)} embeddings to cache ({self.hits} hits, {self.misses} misses)")
+        except Exception as e:
+            print(f"Failed to save embedding cache: {e}")
@@ -0,0 +1,83 @@
+"""
+Enrollment Pool
+กระจายการสกัด embedding จากรูปโปรไฟล์ไปยังหลาย process (แต่ละ process มี model ของตัวเอง)
+"""
+
+import os
+import concurrent.futures
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+
+# Per-process state, set by _init_worker in each pool worker
+_worker_manager = None
+
+
+def _init_worker(model_name, intra_op_threads):
+    """Pool initializer: load a private model session in this worker process"""
+    global _worker_manager
+    from .face_manager import FaceRecognitionManager
+
+    manager = FaceRecognitionManager(None, None)
+    # Keep workers x threads within the core count
+    manager.config["onnx_inter_op_threads"] = 1
+    model_kwargs = manager._model_kwargs(intra_op_threads=intra_op_threads)
+    manager.face_model = FaceRecognitionManager._create_model(model_name, **model_kwargs)
+    manager.model_name = model_name
+    _worker_manager = manager
+    print(f"Enrollment worker {os.getpid()} ready ({model_name}, {intra_op_threads} threads)")
+
+
+def _embed_avatar(name, img_array):
+    """Worker task: return the avatar's (K, 512) float32 embedding set, or None"""
+    return _worker_manager._extract_embeddings(name, img_array)
+
+
+def resolve_worker_count(configured):
+    """0 = single process, N > 0 = N workers, -1 = one per core minus one"""
+    configured = int(configured or 0)
+    if configured < 0:
+        return max(0, (os.cpu_count() or 1) - 1)
+    return configured
+
+
+class EnrollmentPool:
+    """Process pool whose workers each hold their own InsightFace session"""
+
+    def __init__(self, model_name, workers):
+        self.model_name = model_name
+        self.workers = workers
+        # Bound avatar arrays waiting in the parent process
+        self.max_pending = workers * 2
+        self.executor = None
+
+    def start(self):
+        """Start the worker processes; returns False if the pool is unavailable"""
+        try:
+            intra_op_threads = max(1, (os.cpu_count() or 1) // self.workers)
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_init_worker,
+                initargs=(self.model_name, intra_op_threads)
+            )
+            print(f"Enrollment pool started with {self.workers} workers")
+            return True
+        except Exception as e:
+            print(f"Enrollment pool unavailable, using single process: {e}")
+            self.executor = None
+            return False
+
+    def submit(self, name, img_array):
+        """Queue one avatar; returns a Future resolving to an embedding set or None"""
+        return self.executor.submit(_embed_avatar, name, img_array)
+
+    @staticmethod
+    def wait_any(futures):
+        """Block until at least one of the futures is done; returns the done set"""
+        done, _ = concurrent.futures.wait(futures, return_when=concurrent.futures.FIRST_COMPLETED)
+        return done
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.executor = None
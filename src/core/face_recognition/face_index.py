@@ -0,0 +1,199 @@
+"""
+Face Index
+ดัชนีค้นหาใบหน้าใน gallery แบบ exact (brute-force) และแบบประมาณ (IVF / k-means)
+"""
+
+import time
+import numpy as np
+
+from .gallery import normalize_embeddings, score_codes
+
+
+class BruteForceIndex:
+    """Exact search: one matrix product against every gallery row"""
+
+    name = "exact"
+
+    def __init__(self, gallery):
+        self.gallery = gallery
+
+    def __len__(self):
+        return len(self.gallery)
+
+    def search(self, face_embeddings, top_k=1):
+        """Return (indices, scores) shaped (N, top_k), best first"""
+        return self.gallery.match_batch(face_embeddings, top_k=top_k)
+
+
+class IVFIndex:
+    """Approximate search with an inverted file over spherical k-means cells
+
+    The gallery is partitioned into n_lists cells. A probe is compared with
+    the cell centroids first and then only with the members of the n_probe
+    closest cells, so n_probe trades recall for latency (n_probe == n_lists
+    is exact).
+    """
+
+    name = "ivf"
+
+    def __init__(self, gallery, n_lists=0, n_probe=8, train_iterations=10,
+                 max_train_points=256, seed=0):
+        self.gallery = gallery
+        self.n_probe = n_probe
+        self.train_iterations = train_iterations
+        self.max_train_points = max_train_points
+        self.seed = seed
+
+        size = len(gallery)
+        if n_lists <= 0:
+            n_lists = int(round(np.sqrt(size)))
+        self.n_lists = max(1, min(n_lists, size)) if size else 0
+
+        self.centroids = None
+        self.sorted_matrix = None
+        self.sorted_scales = None
+        self.sorted_rows = None
+        self.list_offsets = None
+        self._build()
+
+    def __len__(self):
+        return len(self.gallery)
+
+    def set_n_probe(self, n_probe):
+        """Adjust the recall/latency trade-off without rebuilding"""
+        self.n_probe = max(1, int(n_probe))
+
+    def _build(self):
+        """Train centroids and lay out the gallery contiguously per cell"""
+        matrix = self.gallery.matrix
+        if len(matrix) == 0:
+            return
+
+        start_time = time.time()
+        rng = np.random.default_rng(self.seed)
+
+        # Train on a subsample, then assign every row
+        train_size = min(len(matrix), self.n_lists * self.max_train_points)
+        train_rows = rng.choice(len(matrix), size=train_size, replace=False)
+        train_data = self.gallery.decoded_rows(train_rows)
+
+        centroids = train_data[rng.choice(train_size, size=self.n_lists, replace=False)].copy()
+        for _ in range(self.train_iterations):
+            assignment = self._assign(train_data, centroids)
+            centroids = self._update_centroids(train_data, assignment, centroids, rng)
+
+        # Reduced-precision rows are assigned as stored: a positive row scale
+        # does not change which centroid scores highest
+        assignment = self._assign(matrix, centroids)
+        order = np.argsort(assignment, kind="stable")
+        counts = np.bincount(assignment, minlength=self.n_lists)
+
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.sorted_rows = order
+        # Cells keep the gallery's storage precision
+        self.sorted_matrix = np.ascontiguousarray(matrix[order])
+        if self.gallery.matrix_scales is not None:
+            self.sorted_scales = self.gallery.matrix_scales[order]
+        self.list_offsets = np.concatenate([[0], np.cumsum(counts)])
+
+        print(f"IVF index built: {len(matrix)} faces in {self.n_lists} lists "
+              f"({time.time() - start_time:.2f}s)")
+
+    @staticmethod
+    def _assign(data, centroids, chunk_size=8192):
+        """Nearest centroid per row, chunked to bound the score matrix"""
+        assignment = np.empty(len(data), dtype=np.int64)
+        for start in range(0, len(data), chunk_size):
+            chunk = data[start:start + chunk_size].astype(np.float32, copy=False)
+            assignment[start:start + chunk_size] = np.argmax(chunk @ centroids.T, axis=1)
+        return assignment
+
+    @staticmethod
+    def _update_centroids(data, assignment, centroids, rng):
+        """Mean direction of each cell; empty cells are re-seeded from the data"""
+        order = np.argsort(assignment, kind="stable")
+        counts = np.bincount(assignment, minlength=len(centroids))
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+
+        new_centroids = centroids.copy()
+        non_empty = counts > 0
+        if non_empty.any():
+            sums = np.add.reduceat(data[order], starts[non_empty], axis=0)
+            new_centroids[non_empty] = sums
+
+        empty = np.flatnonzero(~non_empty)
+        if len(empty):
+            new_centroids[empty] = data[rng.choice(len(data), size=len(empty))]
+
+        return normalize_embeddings(new_centroids)
+
+    def search(self, face_embeddings, top_k=1):
+        """Return (indices, scores) shaped (N, top_k), best first
+
+        Rows that cannot be filled (fewer candidates than top_k) get index -1
+        and score -1.0.
+        """
+        probes = normalize_embeddings(np.atleast_2d(face_embeddings))
+        num_probes = len(probes)
+        top_k = max(1, top_k)
+        indices = np.full((num_probes, top_k), -1, dtype=np.int64)
+        scores = np.full((num_probes, top_k), -1.0, dtype=np.float32)
+        if self.centroids is None or num_probes == 0:
+            return indices, scores
+
+        n_probe = min(self.n_probe, self.n_lists)
+        centroid_scores = probes @ self.centroids.T
+        if n_probe < self.n_lists:
+            probed_lists = np.argpartition(-centroid_scores, n_probe - 1, axis=1)[:, :n_probe]
+        else:
+            probed_lists = np.broadcast_to(np.arange(self.n_lists), (num_probes, self.n_lists))
+
+        for i, probe in enumerate(probes):
+            candidate_scores = []
+            candidate_positions = []
+            for cell in probed_lists[i]:
+                start, end = self.list_offsets[cell], self.list_offsets[cell + 1]
+                if start == end:
+                    continue
+                scales = self.sorted_scales[start:end] if self.sorted_scales is not None else None
+                cell_codes = self.sorted_matrix[start:end]
+                candidate_scores.append(score_codes(probe[None, :], cell_codes, scales)[0])
+                candidate_positions.append(np.arange(start, end))
+            if not candidate_scores:
+                continue
+
+            cell_scores = np.concatenate(candidate_scores)
+            positions = np.concatenate(candidate_positions)
+            k = min(top_k, len(cell_scores))
+            if k < len(cell_scores):
+                best = np.argpartition(-cell_scores, k - 1)[:k]
+            else:
+                best = np.arange(len(cell_scores))
+            best = best[np.argsort(-cell_scores[best])]
+
+            indices[i, :k] = self.sorted_rows[positions[best]]
+            scores[i, :k] = cell_scores[best]
+
+        return indices, scores
+
+
+INDEX_BACKENDS = {
+    BruteForceIndex.name: BruteForceIndex,
+    IVFIndex.name: IVFIndex,
+}
+
+
+def build_index(gallery, backend="exact", min_size=0, **options):
+    """Create a search index for the gallery
+
+    Galleries smaller than min_size always use the exact index, since the
+    approximate backends only pay off on large rosters.
+    """
+    if backend not in INDEX_BACKENDS:
+        print(f"Unknown face index backend '{backend}', using exact search")
+        backend = BruteForceIndex.name
+
+    if backend == BruteForceIndex.name or len(gallery) < min_size:
+        return BruteForceIndex(gallery)
+
+    return INDEX_BACKENDS[backend](gallery, **options)
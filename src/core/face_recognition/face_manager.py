@@ -5,6 +5,7 @@ Face Recognition Manager
 
 import os
 import sys
+import json
 import time
 import threading
 import queue
@@ -12,6 +13,31 @@ import numpy as np
 import cv2
 from PIL import Image
 
+from .gallery import FaceGallery, member_embeddings
+from .face_index import build_index
+from .embedding_cache import EmbeddingCache, avatar_fingerprint, get_default_cache_dir
+from .gallery_store import save_gallery, load_gallery
+from .enrollment_pool import EnrollmentPool, BrokenProcessPool, resolve_worker_count
+from .avatar_thumbnail import AvatarThumbnail
+from .onnx_session import build_session_options, ConfiguredFaceAnalysis
+from .batched_analysis import get_faces, detect_faces, embed_faces, supports_batching
+from .face_tracker import FaceTracker
+from .motion_gate import MotionGate
+from .rate_controller import DetectionRateController
+from .detection_zones import DetectionZones
+
+try:
+    config_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..', 'config'))
+    if config_path not in sys.path:
+        sys.path.insert(0, config_path)
+    from global_config import get_face_recognition_config
+    
+except ImportError as e:
+    print(f"Face Manager - Could not import global_config: {e}")
+    def get_face_recognition_config():
+        # Every setting falls back to the default given at its config.get call
+        return {}
+
 # ตรวจสอบ InsightFace และ setup model path
 try:
     import insightface
@@ -36,6 +62,14 @@ except ImportError as e:
     INSIGHTFACE_AVAILABLE = False
 
 
+# Gallery matches need a similarity above this, the same bar as
+# AttendanceManager.similarity_threshold
+MATCH_THRESHOLD = 70
+
+# Model packs tried in order; the last one that loaded is tried first next time
+MODEL_CANDIDATES = ['buffalo_l', 'buffalo_m', 'buffalo_s']
+
+
 class FaceRecognitionManager:
     def __init__(self, face_processing_queue, face_results_queue):
         self.face_processing_queue = face_processing_queue
@@ -43,12 +77,79 @@ class FaceRecognitionManager:
         
         # Face recognition variables
         self.face_model = None
-        self.known_faces = []
+        self.model_name = None
+        self.roster_size = 0
+        self.config = get_face_recognition_config()
+        # Current gallery snapshot; replaced (never modified) by _publish_gallery
+        self.gallery = FaceGallery.empty()
+        self.gallery.index = build_index(self.gallery)
+        # Held by every gallery writer for its whole read-modify-publish
+        self.gallery_lock = threading.RLock()
+        # Live captures from the UI thread, applied by the writer thread
+        self.live_captures = queue.Queue()
+        self.live_capture_thread = None
         self.running = False
         self.frame_count = 0
         
         # Threading
         self.processing_thread = None
+        self.model_thread = None
+        # Face tracks across processed frames (owned by the processing thread)
+        self.tracker = self._create_tracker()
+        
+        # Motion gate in front of face detection (owned by the UI thread)
+        self.motion_gate = None
+        if self.config.get("motion_gate_enabled", True):
+            self.motion_gate = MotionGate(
+                width=self.config.get("motion_gate_width", 80),
+                pixel_threshold=self.config.get("motion_pixel_threshold", 20),
+                min_area=self.config.get("motion_min_area", 0.005),
+                hold_seconds=self.config.get("motion_hold_seconds", 2.0),
+                idle_interval=self.config.get("motion_idle_interval", 5.0)
+            )
+        self.last_motion_report = time.time()
+        
+        # Detections per second from measured latency, queue occupancy and faces
+        self.rate_controller = self._create_rate_controller()
+        
+        # Detection zones of this camera (None = whole frame), see set_camera
+        self.detection_zones = None
+
+    def set_camera(self, camera_name=None, rtsp_url=None):
+        """Pick this camera's detection zones from config by camera name or RTSP URL"""
+        self.detection_zones = DetectionZones.from_config(
+            self.config.get("detection_zones", {}), camera_name, rtsp_url
+        )
+        if self.detection_zones is not None:
+            print(f"Face detection limited to {len(self.detection_zones)} zone(s) for {camera_name or rtsp_url}")
+
+    def _create_rate_controller(self):
+        return DetectionRateController(
+            min_rate=self.config.get("detection_rate_min", 1.0),
+            max_rate=self.config.get("detection_rate_max", 15.0),
+            idle_max_rate=self.config.get("detection_rate_idle_max", 5.0),
+            target_utilization=self.config.get("detection_target_utilization", 0.8),
+            initial_rate=self.config.get("detection_rate_initial", 3.0)
+        )
+
+    def _create_tracker(self):
+        """FaceTracker with the voting settings from config, or None when tracking is off"""
+        if not self.config.get("tracking_enabled", True):
+            return None
+        # By default a vote commits at the attendance threshold, so tracking only
+        # adds the majority of matches and does not raise the bar for attendance
+        accept = self.config.get("track_vote_accept")
+        if accept is None:
+            accept = MATCH_THRESHOLD
+        return FaceTracker(
+            max_age=self.config.get("track_max_age", 1.5),
+            vote_kwargs={
+                "top_k": self.config.get("track_vote_top_k", 3),
+                "min_matches": self.config.get("track_vote_min_matches", 2),
+                "accept": accept,
+                "early_accept": self.config.get("track_vote_early_accept", 85),
+            },
+        )
 
     def initialize_model(self):
         """Initialize InsightFace model with proper error handling"""
@@ -65,25 +166,14 @@ class FaceRecognitionManager:
                 
             # Try loading multiple model formats
             model_loaded = False
+            cached_choice = self._load_model_choice()
             
-            # Try loading buffalo_l first
-            for model_name in ['buffalo_l', 'buffalo_m', 'buffalo_s']:
+            # Start with the pack that worked last time, then buffalo_l, buffalo_m, buffalo_s
+            for model_name in self._model_candidates(cached_choice):
                 try:
-                    print(f"Trying to load {model_name}...")
-                    self.face_model = insightface.app.FaceAnalysis(
-                        name=model_name,
-                        providers=['CPUExecutionProvider']
-                    )
-                    
-                    print(f"Preparing {model_name} model...")
-                    # Use larger detection size for better face detection
-                    self.face_model.prepare(ctx_id=0, det_size=(640, 640), det_thresh=0.5)
-                    
-                    # Test model
-                    test_img = np.random.randint(0, 255, (100, 100, 3), dtype=np.uint8)
-                    test_result = self.face_model.get(test_img)
-                    
+                    self.face_model = self._create_model(model_name, **self._model_kwargs())
                     print(f"✅ {model_name} model loaded and tested successfully")
+                    self.model_name = model_name
                     model_loaded = True
                     break
                     
@@ -91,6 +181,9 @@ class FaceRecognitionManager:
                     print(f"❌ Failed to load {model_name}: {model_error}")
                     continue
             
+            if model_loaded and self.model_name != cached_choice:
+                self._save_model_choice(self.model_name)
+            
             if not model_loaded:
                 print("❌ All model loading attempts failed")
                 self.face_model = None
@@ -105,150 +198,588 @@ class FaceRecognitionManager:
             self.face_model = None
             return False
 
+    def initialize_model_async(self, callback=None, load_persisted_gallery=False):
+        """Load the model on a background thread; callback(success) runs on that thread
+        
+        Keeps the UI responsive during the model download, ONNX session
+        creation and fallback probing. With load_persisted_gallery, the saved
+        gallery is also loaded and indexed on that thread (IVF training
+        included) before the callback, so it is published before any roster
+        load can start.
+        """
+        def load():
+            start_time = time.time()
+            success = self.initialize_model()
+            print(f"Model loading finished in {time.time() - start_time:.1f}s (success: {success})")
+            if success and load_persisted_gallery:
+                try:
+                    # Recognise from the last saved gallery while the roster downloads
+                    if self.load_persisted_gallery():
+                        print("Using saved gallery until student data is loaded")
+                except Exception as e:
+                    print(f"Error loading saved gallery: {e}")
+            if callback:
+                callback(success)
+        
+        self.model_thread = threading.Thread(target=load, daemon=True)
+        self.model_thread.start()
+
+    @staticmethod
+    def _model_candidates(cached_choice=None):
+        """Model packs in the order to try them"""
+        if cached_choice in MODEL_CANDIDATES:
+            return [cached_choice] + [name for name in MODEL_CANDIDATES if name != cached_choice]
+        return list(MODEL_CANDIDATES)
+
+    def _model_choice_path(self):
+        return os.path.join(self._cache_dir(), "model_choice.json")
+
+    def _load_model_choice(self):
+        """Model pack that loaded successfully on a previous start, or None"""
+        try:
+            with open(self._model_choice_path(), 'r', encoding='utf-8') as f:
+                return json.load(f).get("model_name")
+        except (OSError, ValueError):
+            return None
+
+    def _save_model_choice(self, model_name):
+        try:
+            os.makedirs(self._cache_dir(), exist_ok=True)
+            with open(self._model_choice_path(), 'w', encoding='utf-8') as f:
+                json.dump({"model_name": model_name, "saved_at": time.time()}, f)
+        except OSError as e:
+            print(f"Failed to save model choice: {e}")
+
+    def _model_kwargs(self, intra_op_threads=None):
+        """ConfiguredFaceAnalysis keyword arguments from config: model subset and ONNX session options
+        
+        Only the detector and the ArcFace recognizer are loaded by default;
+        the landmark and gender/age heads are never used here and would
+        otherwise run on every face_model.get.
+        """
+        model_kwargs = {}
+        modules = self.config.get("model_modules", ["detection", "recognition"])
+        if modules:
+            model_kwargs["allowed_modules"] = list(modules)
+        model_kwargs["session_options"] = build_session_options(self.config, intra_op_threads)
+        return model_kwargs
+
+    @staticmethod
+    def _create_model(model_name, **model_kwargs):
+        """Create, prepare and smoke-test one InsightFace model pack"""
+        print(f"Trying to load {model_name}...")
+        face_model = ConfiguredFaceAnalysis(
+            name=model_name,
+            providers=['CPUExecutionProvider'],
+            **model_kwargs
+        )
+        
+        print(f"Preparing {model_name} model...")
+        # Use larger detection size for better face detection
+        face_model.prepare(ctx_id=0, det_size=(640, 640), det_thresh=0.5)
+        
+        # Test model
+        test_img = np.random.randint(0, 255, (100, 100, 3), dtype=np.uint8)
+        face_model.get(test_img)
+        return face_model
+
     def load_known_faces(self, students_data, progress_callback=None):
-        """Load known faces from student data with progress callback"""
+        """Load known faces from student data with progress callback
+        
+        students_data may be a list or any iterable (e.g. APIClient.iter_students).
+        Each student's decoded avatar is released as soon as its embedding and
+        thumbnail exist, so only the card-sized JPEG thumbnails stay resident.
+        
+        Loading is incremental: members whose avatar fingerprint matches the
+        current gallery keep their entry, only added or changed avatars are
+        embedded, members whose avatar failed to download keep their entry,
+        and members missing from the roster are dropped. The new
+        gallery replaces the old one in a single swap, so the processing
+        thread can keep matching throughout.
+        """
         if self.face_model is None:
             print("Face model is None, skipping face loading")
             return []
             
         known_faces = []
+        roster_member_ids = []
+        roster_complete = False
+        embedding_cache = self._open_embedding_cache()
+        previous_faces = {
+            face["member_id"]: face for face in self.known_faces
+            if face.get("member_id") and face.get("fingerprint")
+        }
+        enrollment = _PooledEnrollment(self, embedding_cache, known_faces, previous_faces)
         try:
-            total_students = len(students_data)
-            print(f"Processing {total_students} students for face recognition")
+            total_students = len(students_data) if hasattr(students_data, '__len__') else None
+            if total_students is not None:
+                print(f"Processing {total_students} students for face recognition")
+            else:
+                print("Processing streamed students for face recognition")
             
-            if progress_callback:
+            if progress_callback and total_students is not None:
                 progress_callback("เริ่มประมวลผลใบหน้า...", 80)
             
             for i, student in enumerate(students_data):
                 name = student["display_name"]
-                member_id = student["member_id"]
-                avatar_image = student["avatar_image"]
+                roster_member_ids.append(student["member_id"])
                 
-                # Update progress for face processing
-                if progress_callback and total_students > 0:
+                # Update progress for face processing (streamed rosters report their own progress)
+                if progress_callback and total_students:
                     progress = 80 + int((i / total_students) * 18)  # 80% to 98%
                     progress_callback(f"ประมวลผลใบหน้า: {name}", progress)
                 
-                if avatar_image is None:
-                    print(f"Avatar image for {name} is None. Skipping...")
-                    continue
-                    
-                try:
-                    # Validate PIL Image
-                    if not hasattr(avatar_image, 'convert'):
-                        print(f"Invalid image type for {name}. Skipping...")
-                        continue
-                    
-                    # Check image size
-                    width, height = avatar_image.size
-                    if width < 50 or height < 50:
-                        print(f"Image too small for {name}: {width}x{height}. Skipping...")
-                        continue
-                    
-                    # Resize large images
-                    if width > 800 or height > 800:
-                        print(f"Resizing large image for {name}: {width}x{height}")
-                        max_size = 800
-                        if width > height:
-                            new_width = max_size
-                            new_height = int(height * max_size / width)
-                        else:
-                            new_height = max_size
-                            new_width = int(width * max_size / height)
-                        avatar_image = avatar_image.resize((new_width, new_height), Image.LANCZOS)
-                    
-                    # Convert to RGB and numpy array
-                    img_rgb = avatar_image.convert("RGB")
-                    img_array = np.array(img_rgb, dtype=np.uint8)
-                    
-                    # Validate array
-                    if img_array is None or img_array.size == 0:
-                        print(f"Invalid image array for {name}. Skipping...")
-                        continue
-                        
-                    if len(img_array.shape) != 3 or img_array.shape[2] != 3:
-                        print(f"Invalid image shape for {name}: {img_array.shape}. Skipping...")
-                        continue
-                    
-                    # Ensure contiguous array
-                    if not img_array.flags['C_CONTIGUOUS']:
-                        img_array = np.ascontiguousarray(img_array)
-                    
-                    print(f"Processing face detection for {name} - image shape: {img_array.shape}")
-                    
-                    # Use InsightFace to detect faces with retry mechanism
-                    faces = None
-                    for attempt in range(3):
-                        try:
-                            faces = self.face_model.get(img_array)
-                            break
-                        except Exception as face_error:
-                            print(f"Face detection attempt {attempt + 1} failed for {name}: {face_error}")
-                            if attempt == 2:  # Last attempt
-                                # Try with smaller image
-                                try:
-                                    small_img = cv2.resize(img_array, (300, 300))
-                                    small_img = np.ascontiguousarray(small_img)
-                                    faces = self.face_model.get(small_img)
-                                    print(f"Small image detection succeeded for {name}")
-                                except Exception as small_error:
-                                    print(f"Small image detection also failed for {name}: {small_error}")
-                                    break
-                            else:
-                                time.sleep(0.1)  # Short delay before retry
-                    
-                    if faces is None:
-                        print(f"No faces detected for {name}")
-                        continue
-                        
-                    if len(faces) == 0:
-                        print(f"No faces found in image for {name}")
-                        continue
-                        
-                    if len(faces) > 1:
-                        print(f"Multiple faces detected for {name}, using first face")
-                    
-                    # Use first detected face
-                    face = faces[0]
-                    
-                    # Check embedding
-                    if not hasattr(face, 'embedding') or face.embedding is None:
-                        print(f"No embedding found for {name}")
-                        continue
-                        
-                    embedding = face.embedding
-                    
-                    if embedding.size == 0:
-                        print(f"Empty embedding for {name}")
-                        continue
-                        
-                    known_faces.append({
-                        "name": name,
-                        "member_id": member_id,
-                        "embedding": embedding,
-                        "avatar_image": avatar_image
-                    })
-                    print(f"✅ Successfully added face for {name}")
-                    
-                except Exception as e:
-                    print(f"❌ Error processing image for {name}: {e}")
-                    import traceback
-                    traceback.print_exc()
-                    continue
+                if enrollment.enabled:
+                    enrollment.add(student)
+                else:
+                    known_face = self._enroll_student(student, embedding_cache, previous_faces)
+                    if known_face is not None:
+                        known_faces.append(known_face)
+                
+                # Release the full-size avatar; the gallery keeps only the thumbnail
+                student["avatar_image"] = None
+                
+            enrollment.finish()
+            roster_complete = True
                     
         except Exception as e:
             print(f"❌ Error loading known faces: {e}")
             import traceback
             traceback.print_exc()
+        finally:
+            enrollment.close()
+            
+        if embedding_cache:
+            # Only a complete, non-empty roster says who has left; keep the cache otherwise
+            removed = 0
+            if roster_complete and roster_member_ids:
+                removed = embedding_cache.evict_missing(roster_member_ids)
+            if removed:
+                print(f"Removed {removed} departed members from embedding cache")
+            embedding_cache.save()
+            
+        if not roster_complete and len(self.gallery) > 0:
+            # A failed download must not replace a working gallery with a partial one
+            print(f"Roster load incomplete, keeping current gallery ({len(self.gallery)} faces)")
+            if progress_callback:
+                progress_callback("โหลดข้อมูลไม่สำเร็จ ใช้ข้อมูลเดิม", 100)
+            return self.known_faces
+            
+        self.roster_size = len(roster_member_ids)
+        with self.gallery_lock:
+            known_faces = self._carry_live_captures(known_faces)
+            self._publish_gallery(known_faces)
+            
+        if previous_faces:
+            reused = sum(
+                1 for face in known_faces
+                if face["member_id"] in previous_faces
+                and face["embedding"] is previous_faces[face["member_id"]]["embedding"]
+            )
+            removed = len(set(previous_faces) - {face["member_id"] for face in known_faces})
+            print(f"Incremental refresh: {reused} unchanged, {len(known_faces) - reused} embedded or updated, "
+                  f"{removed} removed")
             
         print(f"Successfully loaded {len(known_faces)} known faces")
-        self.known_faces = known_faces
+        if known_faces and self.config.get("gallery_file_enabled", True):
+            save_gallery(self.gallery, self._cache_dir(), self.model_name,
+                         dtype=self.config.get("gallery_file_dtype", "float32"))
         
         if progress_callback:
             progress_callback("เสร็จสิ้นการโหลดข้อมูล!", 100)
             
         return known_faces
 
+    def _enroll_student(self, student, embedding_cache=None, previous_faces=None):
+        """Build the known_faces entry for one student, or None if unusable"""
+        known_face, job = self._prepare_enrollment(student, embedding_cache, previous_faces)
+        if job is None:
+            return known_face
+        
+        try:
+            embeddings = self._extract_embeddings(job["name"], job["img_array"])
+        except Exception as e:
+            print(f"❌ Error processing image for {job['name']}: {e}")
+            import traceback
+            traceback.print_exc()
+            return None
+        return self._finish_enrollment(job, embeddings, embedding_cache)
+
+    def _prepare_enrollment(self, student, embedding_cache=None, previous_faces=None):
+        """First enrollment step, run on the loading thread
+        
+        Returns (known_face, None) when the current gallery or the embedding
+        cache already has this avatar, (None, job) when the avatar still needs
+        inference, or (None, None) if it is unusable.
+        """
+        name = student["display_name"]
+        member_id = student["member_id"]
+        avatar_image = student["avatar_image"]
+        
+        if avatar_image is None:
+            # A failed download (timeout, 5xx) must not drop a member still on the roster
+            previous = previous_faces.get(member_id) if previous_faces and member_id else None
+            if previous is not None:
+                print(f"Avatar image for {name} is None. Keeping current face")
+                return dict(previous, name=name), None
+            print(f"Avatar image for {name} is None. Skipping...")
+            return None, None
+        
+        fingerprint = avatar_fingerprint(student) if member_id else None
+        
+        # Unchanged member already in the live gallery - keep its entry as is
+        previous = previous_faces.get(member_id) if previous_faces and fingerprint else None
+        if previous is not None and previous["fingerprint"] == fingerprint:
+            return dict(previous, name=name), None
+        
+        # Unchanged avatars reuse the embedding computed on a previous run
+        if fingerprint and embedding_cache:
+            cached_embeddings = embedding_cache.get(member_id, fingerprint)
+            if cached_embeddings is not None:
+                return self._known_face_entry(
+                    name, member_id, fingerprint, cached_embeddings,
+                    AvatarThumbnail.from_image(avatar_image)
+                ), None
+            
+        try:
+            prepared = self._prepare_avatar_array(name, avatar_image)
+            if prepared is None:
+                return None, None
+            avatar_image, img_array = prepared
+            
+            return None, {
+                "name": name,
+                "member_id": member_id,
+                "fingerprint": fingerprint,
+                "thumbnail": AvatarThumbnail.from_image(avatar_image),
+                "img_array": img_array
+            }
+            
+        except Exception as e:
+            print(f"❌ Error processing image for {name}: {e}")
+            import traceback
+            traceback.print_exc()
+            return None, None
+
+    def _finish_enrollment(self, job, embeddings, embedding_cache=None):
+        """Last enrollment step: turn extracted embeddings into a known_faces entry"""
+        if embeddings is None:
+            return None
+            
+        if job["fingerprint"] and embedding_cache:
+            embedding_cache.put(job["member_id"], job["fingerprint"], embeddings)
+        print(f"✅ Successfully added face for {job['name']}")
+        return self._known_face_entry(
+            job["name"], job["member_id"], job["fingerprint"], embeddings, job["thumbnail"]
+        )
+
+    @staticmethod
+    def _known_face_entry(name, member_id, fingerprint, embeddings, thumbnail):
+        """known_faces entry; "embedding" is the avatar's own, "embeddings" the whole set"""
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        embeddings = embeddings.reshape(-1, embeddings.shape[-1])
+        return {
+            "name": name,
+            "member_id": member_id,
+            "fingerprint": fingerprint,
+            "embedding": embeddings[0],
+            "embeddings": embeddings,
+            "live_count": 0,
+            "avatar_image": thumbnail
+        }
+
+    @staticmethod
+    def _prepare_avatar_array(name, avatar_image):
+        """Validate and resize an avatar; returns (resized image, RGB array) or None"""
+        # Validate PIL Image
+        if not hasattr(avatar_image, 'convert'):
+            print(f"Invalid image type for {name}. Skipping...")
+            return None
+        
+        # Check image size
+        width, height = avatar_image.size
+        if width < 50 or height < 50:
+            print(f"Image too small for {name}: {width}x{height}. Skipping...")
+            return None
+        
+        # Resize large images
+        if width > 800 or height > 800:
+            print(f"Resizing large image for {name}: {width}x{height}")
+            max_size = 800
+            if width > height:
+                new_width = max_size
+                new_height = int(height * max_size / width)
+            else:
+                new_height = max_size
+                new_width = int(width * max_size / height)
+            avatar_image = avatar_image.resize((new_width, new_height), Image.LANCZOS)
+        
+        # Convert to RGB and numpy array
+        img_rgb = avatar_image.convert("RGB")
+        img_array = np.array(img_rgb, dtype=np.uint8)
+        
+        # Validate array
+        if img_array is None or img_array.size == 0:
+            print(f"Invalid image array for {name}. Skipping...")
+            return None
+            
+        if len(img_array.shape) != 3 or img_array.shape[2] != 3:
+            print(f"Invalid image shape for {name}: {img_array.shape}. Skipping...")
+            return None
+        
+        # Ensure contiguous array
+        if not img_array.flags['C_CONTIGUOUS']:
+            img_array = np.ascontiguousarray(img_array)
+        
+        return avatar_image, img_array
+
+    def _extract_embedding(self, name, img_array):
+        """Detect the avatar face and return its embedding, or None"""
+        print(f"Processing face detection for {name} - image shape: {img_array.shape}")
+        
+        # Use InsightFace to detect faces with retry mechanism
+        faces = None
+        for attempt in range(3):
+            try:
+                faces = self.face_model.get(img_array)
+                break
+            except Exception as face_error:
+                print(f"Face detection attempt {attempt + 1} failed for {name}: {face_error}")
+                if attempt == 2:  # Last attempt
+                    # Try with smaller image
+                    try:
+                        small_img = cv2.resize(img_array, (300, 300))
+                        small_img = np.ascontiguousarray(small_img)
+                        faces = self.face_model.get(small_img)
+                        print(f"Small image detection succeeded for {name}")
+                    except Exception as small_error:
+                        print(f"Small image detection also failed for {name}: {small_error}")
+                        break
+                else:
+                    time.sleep(0.1)  # Short delay before retry
+        
+        if faces is None:
+            print(f"No faces detected for {name}")
+            return None
+            
+        if len(faces) == 0:
+            print(f"No faces found in image for {name}")
+            return None
+            
+        if len(faces) > 1:
+            print(f"Multiple faces detected for {name}, using first face")
+        
+        # Use first detected face
+        face = faces[0]
+        
+        # Check embedding
+        if not hasattr(face, 'embedding') or face.embedding is None:
+            print(f"No embedding found for {name}")
+            return None
+            
+        embedding = face.embedding
+        
+        if embedding.size == 0:
+            print(f"Empty embedding for {name}")
+            return None
+            
+        return embedding
+
+    def _extract_embeddings(self, name, img_array):
+        """Embedding set of an avatar: (K, 512) float32, or None if no face was found
+        
+        Row 0 is the avatar itself; with enrollment_flip_augment the mirrored
+        avatar adds a second row.
+        """
+        embedding = self._extract_embedding(name, img_array)
+        if embedding is None:
+            return None
+        embeddings = [np.asarray(embedding, dtype=np.float32).ravel()]
+        
+        if self.config.get("enrollment_flip_augment", False):
+            flipped = np.ascontiguousarray(img_array[:, ::-1])
+            flipped_embedding = self._extract_embedding(f"{name} (flipped)", flipped)
+            if flipped_embedding is not None:
+                embeddings.append(np.asarray(flipped_embedding, dtype=np.float32).ravel())
+        
+        return np.stack(embeddings)
+
+    def add_live_embedding(self, member_id, embedding):
+        """Queue a confirmed live capture for a member's embedding set
+        
+        Cheap enough for the UI thread: the gallery is rebuilt by the live
+        capture writer thread (see _apply_live_captures). Returns True if
+        the capture was queued.
+        """
+        if not member_id or embedding is None:
+            return False
+        self.live_captures.put((member_id, np.asarray(embedding, dtype=np.float32).ravel().copy()))
+        
+        with self.gallery_lock:
+            if self.live_capture_thread is None or not self.live_capture_thread.is_alive():
+                self.live_capture_thread = threading.Thread(target=self._live_capture_loop, daemon=True)
+                self.live_capture_thread.start()
+        return True
+
+    def _live_capture_loop(self):
+        """Writer thread: fold queued live captures into one new snapshot at a time"""
+        while True:
+            captures = [self.live_captures.get()]
+            while True:
+                try:
+                    captures.append(self.live_captures.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._apply_live_captures(captures)
+            except Exception as e:
+                print(f"Error adding live captures: {e}")
+
+    def _apply_live_captures(self, captures):
+        """Add (member_id, embedding) captures to the gallery; returns the number applied
+        
+        Avatar-derived rows are always kept; once a set holds
+        embeddings_per_member rows its oldest live capture is replaced. Runs
+        under gallery_lock, so a roster refresh publishing at the same time
+        cannot drop the captures or be overwritten by an older snapshot.
+        """
+        limit = int(self.config.get("embeddings_per_member", 5))
+        with self.gallery_lock:
+            gallery = self.gallery
+            known_faces = list(gallery.entries)
+            applied = 0
+            for member_id, embedding in captures:
+                row = gallery.row_for_member(member_id)
+                if gallery.entry_at(row) is None:
+                    continue
+                known_face = known_faces[row]
+                
+                embeddings = member_embeddings(known_face)
+                live_count = known_face.get("live_count", 0)
+                avatar_count = len(embeddings) - live_count
+                if avatar_count >= limit or embedding.shape[0] != embeddings.shape[1]:
+                    continue
+                
+                if len(embeddings) >= limit:
+                    # Drop the oldest live capture, which follows the avatar rows
+                    embeddings = np.delete(embeddings, avatar_count, axis=0)
+                    live_count -= 1
+                embeddings = np.concatenate([embeddings, embedding[None, :]])
+                known_faces[row] = dict(known_face, embeddings=embeddings, embedding_scales=None,
+                                        live_count=live_count + 1)
+                applied += 1
+            
+            if applied:
+                self._publish_gallery(known_faces)
+        return applied
+
+    def _carry_live_captures(self, known_faces):
+        """Keep live captures the current gallery gained while a refresh was running
+        
+        Members whose avatar is unchanged take their embedding set (avatar
+        rows plus live captures) from the current snapshot. Call with
+        gallery_lock held.
+        """
+        current = self.gallery
+        carried = []
+        for known_face in known_faces:
+            entry = current.entry_at(current.row_for_member(known_face.get("member_id")))
+            if (entry is not None and entry.get("live_count")
+                    and entry.get("fingerprint") == known_face.get("fingerprint")):
+                known_face = dict(known_face, embeddings=entry["embeddings"],
+                                  embedding_scales=entry.get("embedding_scales"),
+                                  live_count=entry["live_count"])
+            carried.append(known_face)
+        return carried
+
+    @property
+    def known_faces(self):
+        """known_faces entries of the current gallery snapshot"""
+        return list(self.gallery.entries)
+
+    def set_known_faces(self, known_faces):
+        """Replace the gallery with one built from known_faces entries"""
+        self._publish_gallery(known_faces)
+
+    def _publish_gallery(self, known_faces=None, gallery=None):
+        """Build the next snapshot and its index off to the side, then swap it in
+        
+        Writers hold gallery_lock (re-entrant) across their whole
+        read-modify-publish; readers never take it.
+        """
+        with self.gallery_lock:
+            version = self.gallery.version + 1
+            if gallery is None:
+                gallery = FaceGallery.from_known_faces(
+                    known_faces, version=version,
+                    aggregation=self.config.get("match_aggregation", "max"),
+                    storage_dtype=self.config.get("gallery_storage_dtype", "float32")
+                )
+            else:
+                gallery.version = version
+            gallery.index = self._build_index(gallery)
+            # Single reference assignment - readers see either the old or the new snapshot
+            self.gallery = gallery
+        print(f"Gallery v{gallery.version} published: {len(gallery)} faces")
+
+    def _cache_dir(self):
+        """Directory for the embedding cache and gallery file"""
+        return self.config.get("cache_dir", "") or get_default_cache_dir()
+
+    def load_persisted_gallery(self):
+        """Start from the gallery file saved by the last load_known_faces
+        
+        Lets recognition run before the roster has been downloaded. Only the
+        embedding matrix and member index are restored; avatar images arrive
+        with the next load_known_faces.
+        """
+        if self.face_model is None or not self.config.get("gallery_file_enabled", True):
+            return False
+            
+        gallery = load_gallery(self._cache_dir(), self.model_name,
+                               aggregation=self.config.get("match_aggregation", "max"),
+                               storage_dtype=self.config.get("gallery_storage_dtype", "float32"))
+        if gallery is None or len(gallery) == 0:
+            return False
+            
+        self._publish_gallery(gallery=gallery)
+        return True
+
+    def _open_embedding_cache(self):
+        """Open the on-disk embedding cache for the loaded model (None if disabled)"""
+        if not self.config.get("embedding_cache_enabled", True):
+            return None
+        try:
+            return EmbeddingCache(self._cache_dir(), self.model_name).load()
+        except Exception as e:
+            print(f"Embedding cache unavailable: {e}")
+            return None
+
+    def _build_index(self, gallery):
+        """Build the configured gallery search index"""
+        backend = self.config.get("index_backend", "exact")
+        options = {}
+        if backend == "ivf":
+            options = {
+                "n_lists": self.config.get("ivf_n_lists", 0),
+                "n_probe": self.config.get("ivf_n_probe", 8)
+            }
+        return build_index(
+            gallery,
+            backend=backend,
+            min_size=self.config.get("index_min_gallery_size", 5000),
+            **options
+        )
+
+    def set_index_backend(self, backend, **options):
+        """Switch gallery search backend ("exact" or "ivf") and rebuild the index"""
+        self.config["index_backend"] = backend
+        for key, value in options.items():
+            self.config[f"{backend}_{key}"] = value
+        with self.gallery_lock:
+            current = self.gallery
+            self._publish_gallery(gallery=current.derive(current.version))
+
     def start_processing(self):
         """Start face processing thread"""
         if self.face_model is None:
@@ -272,11 +803,76 @@ class FaceRecognitionManager:
                     print("Warning: face processing thread did not stop gracefully")
             except Exception as e:
                 print(f"Error stopping face processing thread: {e}")
+        
+        # Face tracks across processed frames (owned by the processing thread)
+        self.tracker = self._create_tracker()
+        self._report_detection_stats()
+        if self.motion_gate is not None:
+            self.motion_gate.reset()
+        self.rate_controller = self._create_rate_controller()
+
+    def should_process_frame(self, frame=None):
+        """Determine if frame should be processed for face detection
+        
+        Frames are paced by time at the rate_controller's current rate
+        rather than by counting frames, so the detection rate follows what
+        the host can sustain instead of the camera's frame rate.
+        """
+        now = time.time()
+        controller = self.rate_controller
+        if not controller.due(now):
+            return False
+        controller.start_slot(now)
+        
+        interval = self.config.get("motion_report_interval", 300)
+        if interval and now - self.last_motion_report >= interval:
+            self._report_detection_stats()
+        
+        # Previous frame still waiting: processing is falling behind
+        if not self.face_processing_queue.empty():
+            controller.record_busy()
+            return False
+        
+        # Static scene: skip detection
+        if self.motion_gate is not None and frame is not None and not self.motion_gate.should_detect(frame, now):
+            return False
+        
+        controller.record_dispatch(now)
+        return True
+
+    def get_detection_rate_stats(self):
+        """Current, target and measured detection rate with the latency behind them"""
+        return self.rate_controller.metrics()
 
-    def should_process_frame(self, frame_count):
-        """Determine if frame should be processed for face detection"""
-        # Process every 10th frame for faster face detection (was 30)
-        return frame_count % 10 == 0 and self.face_processing_queue.empty()
+    def get_motion_stats(self):
+        """Frames skipped by the motion gate and the detection time they saved"""
+        gate = self.motion_gate
+        if gate is None:
+            return None
+        latency = self.rate_controller.latency
+        saved_seconds = gate.skipped * latency - gate.gate_seconds
+        return {
+            "checked_frames": gate.checked,
+            "skipped_frames": gate.skipped,
+            "skipped_ratio": gate.skipped / gate.checked if gate.checked else 0.0,
+            "frame_process_ms": latency * 1000,
+            "gate_ms": gate.gate_seconds * 1000 / gate.checked if gate.checked else 0.0,
+            "saved_cpu_seconds": max(saved_seconds, 0.0)
+        }
+
+    def _report_detection_stats(self):
+        self.last_motion_report = time.time()
+        rate = self.get_detection_rate_stats()
+        if rate["dispatched_frames"]:
+            print(f"Detection rate: {rate['rate']:.1f}/s (target {rate['target_rate']:.1f}/s, "
+                  f"measured {rate['measured_rate']:.1f}/s, {rate['latency_ms']:.1f} ms/frame, "
+                  f"{rate['busy_slots']} busy slots)")
+        stats = self.get_motion_stats()
+        if not stats or not stats["checked_frames"]:
+            return
+        print(f"Motion gate: skipped {stats['skipped_frames']}/{stats['checked_frames']} frames "
+              f"({stats['skipped_ratio']:.0%}), ~{stats['saved_cpu_seconds']:.1f}s detection CPU saved "
+              f"({stats['frame_process_ms']:.1f} ms/frame, gate {stats['gate_ms']:.2f} ms/frame)")
 
     def add_frame_for_processing(self, frame):
         """Add frame to processing queue"""
@@ -317,6 +913,9 @@ class FaceRecognitionManager:
                     continue
 
                 try:
+                    # One gallery snapshot per frame, even if a reload swaps it meanwhile
+                    gallery = self.gallery
+                    
                     # Process frame
                     frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
                     
@@ -328,13 +927,19 @@ class FaceRecognitionManager:
                         frame_rgb = np.ascontiguousarray(frame_rgb)
                     
                     # Face detection with retry
+                    start = time.perf_counter()
                     faces = self._detect_faces_with_retry(frame_rgb, frame)
                     
                     if faces is None:
                         continue
                     
                     # Process detected faces
-                    face_results = self._process_detected_faces(faces, frame)
+                    face_results = self._process_detected_faces(faces, frame, gallery)
+                    self.rate_controller.record_frame(
+                        time.perf_counter() - start,
+                        faces=len(face_results),
+                        pending_faces=sum(1 for result in face_results if not result.get("confirmed", False))
+                    )
 
                     # Send results to UI
                     self._send_results_to_ui(face_results)
@@ -356,7 +961,7 @@ class FaceRecognitionManager:
         faces = None
         for attempt in range(2):
             try:
-                faces = self.face_model.get(frame_rgb)
+                faces = self._get_faces(frame_rgb)
                 break
             except Exception as face_error:
                 if attempt == 0:
@@ -364,11 +969,11 @@ class FaceRecognitionManager:
                     try:
                         smaller_frame = cv2.resize(frame_rgb, (640, 480))
                         smaller_frame = np.ascontiguousarray(smaller_frame)
-                        faces = self.face_model.get(smaller_frame)
+                        scale_x = original_frame.shape[1] / 640
+                        scale_y = original_frame.shape[0] / 480
+                        faces = self._get_faces(smaller_frame, scale=(scale_x, scale_y))
                         # Scale bbox back
                         if faces:
-                            scale_x = original_frame.shape[1] / 640
-                            scale_y = original_frame.shape[0] / 480
                             for face in faces:
                                 if hasattr(face, 'bbox') and face.bbox is not None:
                                     face.bbox = face.bbox * np.array([scale_x, scale_y, scale_x, scale_y])
@@ -380,15 +985,52 @@ class FaceRecognitionManager:
                     break
         return faces
 
-    def _process_detected_faces(self, faces, frame):
+    def _get_faces(self, frame_rgb, scale=(1.0, 1.0)):
+        """Detect faces and embed them with batched recognizer calls
+        
+        With tracking, faces are first associated with tracks (in original
+        frame coordinates, hence scale) and only faces whose track has not
+        committed to an identity are embedded; the others carry face.track.
+        With detection zones, only the zones of frame_rgb are searched.
+        """
+        max_batch_size = int(self.config.get("recognition_batch_size", 16))
+        regions = None
+        if self.detection_zones is not None:
+            regions = self.detection_zones.regions(frame_rgb.shape[1], frame_rgb.shape[0], scale)
+        
+        if self.tracker is None or not supports_batching(self.face_model):
+            return get_faces(self.face_model, frame_rgb, max_batch_size=max_batch_size,
+                             regions=regions)
+        
+        timestamp = time.time()
+        faces = detect_faces(self.face_model, frame_rgb, regions)
+        box_scale = np.array([scale[0], scale[1], scale[0], scale[1]])
+        tracks = self.tracker.update([face.bbox * box_scale for face in faces], timestamp)
+        
+        reembed_interval = self.config.get("track_reembed_interval", 1.0)
+        verify_interval = self.config.get("track_verify_interval", 3.0)
+        pending = []
+        for face, track in zip(faces, tracks):
+            face.track = track
+            if track.needs_embedding(timestamp, reembed_interval, verify_interval):
+                pending.append(face)
+        embed_faces(self.face_model, frame_rgb, pending, max_batch_size=max_batch_size)
+        return faces
+
+    def _process_detected_faces(self, faces, frame, gallery=None):
         """Process detected faces and extract information"""
-        face_results = []
+        if gallery is None:
+            gallery = self.gallery
+        embedding_dim = gallery.matrix.shape[1]
+        candidates = []
         for i, face in enumerate(faces):
             try:
                 if not hasattr(face, 'bbox') or not hasattr(face, 'embedding'):
                     continue
                     
-                bbox = face.bbox
+                track = getattr(face, 'track', None)
+                # Tracked faces are drawn with their Kalman-smoothed box
+                bbox = track.box if track is not None else face.bbox
                 if bbox is None or len(bbox) < 4:
                     continue
                     
@@ -419,22 +1061,58 @@ class FaceRecognitionManager:
                     continue
 
                 face_embedding = face.embedding
-                if face_embedding is None:
+                if face_embedding is not None:
+                    # Checked here so one malformed embedding cannot fail the batch for the whole frame
+                    face_embedding = np.ravel(np.asarray(face_embedding, dtype=np.float32))
+                    if face_embedding.size != embedding_dim or not np.all(np.isfinite(face_embedding)):
+                        print(f"Skipping invalid embedding of face {i} (size {face_embedding.size})")
+                        face_embedding = None
+                if face_embedding is None and (track is None or track.embedded_at is None):
                     continue
                     
-                name, similarity, member_id = self.compare_faces(face_embedding)
-
-                face_results.append({
-                    "bbox": (x, y, w, h),
-                    "name": name,
-                    "member_id": member_id,
-                    "similarity": similarity,
-                    "embedding": face_embedding,
-                    "timestamp": time.time()
-                })
+                candidates.append(((x, y, w, h), face_embedding, track))
                     
             except Exception as e:
                 print(f"Error processing face {i}: {e}")
+        
+        if not candidates:
+            return []
+        
+        # Match every freshly embedded face in the frame with a single pass over the gallery
+        embedded = [candidate for candidate in candidates if candidate[1] is not None]
+        matches = {}
+        if embedded:
+            embeddings = np.stack([embedding for _, embedding, _ in embedded])
+            matches = dict(zip(map(id, embedded), self.compare_faces_batch(embeddings, gallery=gallery)))
+        
+        face_results = []
+        timestamp = time.time()
+        for candidate in candidates:
+            bbox, face_embedding, track = candidate
+            if track is None:
+                name, similarity, member_id = matches[id(candidate)]
+            else:
+                if face_embedding is not None:
+                    committed_to = track.name if track.committed else None
+                    track.add_match(*matches[id(candidate)], timestamp)
+                    if committed_to is not None and not track.committed:
+                        print(f"Track {track.track_id}: verification no longer matches {committed_to}, voting again")
+                # The track's vote so far, not just this frame's match
+                name, similarity, member_id = track.name, track.similarity, track.member_id
+            
+            result = {
+                "bbox": bbox,
+                "name": name,
+                "member_id": member_id,
+                "similarity": similarity,
+                "embedding": face_embedding,
+                "timestamp": timestamp
+            }
+            if track is not None:
+                result["track_id"] = track.track_id
+                result["confirmed"] = track.committed
+                result["velocity"] = tuple(float(v) for v in track.velocity)
+            face_results.append(result)
                 
         return face_results
 
@@ -457,43 +1135,161 @@ class FaceRecognitionManager:
             except queue.Empty:
                 break
 
-    def compare_faces(self, face_embedding):
+    def compare_faces(self, face_embedding, gallery=None):
         """Compare face embedding with known faces"""
-        if not self.known_faces:
+        try:
+            return self.compare_faces_batch(np.ravel(face_embedding)[None, :], gallery=gallery)[0]
+        except Exception as e:
+            print(f"Error comparing face: {e}")
             return None, 0, None
-            
-        best_match = None
-        member_id = None
-        best_similarity = 0
+
+    def compare_faces_batch(self, face_embeddings, top_k=1, gallery=None):
+        """Compare an (N, 512) stack of face embeddings with known faces
         
-        for known_face in self.known_faces:
-            try:
-                known_embedding = known_face["embedding"]
-                similarity = np.dot(face_embedding, known_embedding) / (
-                    np.linalg.norm(face_embedding) * np.linalg.norm(known_embedding)
-                )
-                similarity = (similarity + 1) / 2 * 100
-                
-                if similarity > best_similarity:
-                    best_similarity = similarity
-                    member_id = known_face["member_id"] or known_face["name"]
-                    best_match = known_face["name"]
-            except Exception as e:
-                print(f"Error comparing face: {e}")
-                continue
+        Returns one (name, similarity, member_id) tuple per face, or a list of
+        top_k such tuples per face when top_k > 1. Matches against the given
+        gallery snapshot, or the current one.
+        """
+        face_embeddings = np.atleast_2d(face_embeddings)
+        if gallery is None:
+            gallery = self.gallery
+        index = gallery.index
+        if len(gallery) == 0 or index is None:
+            no_match = (None, 0, None)
+            return [no_match if top_k == 1 else [] for _ in range(len(face_embeddings))]
         
-        if best_similarity > 70:
-            return best_match, best_similarity, member_id
-        else:
-            return None, best_similarity, None
+        indices, cosines = index.search(face_embeddings, top_k=top_k)
+        # Reduced-precision galleries can overshoot +-1 by a rounding error
+        similarities = (np.clip(cosines, -1, 1) + 1) / 2 * 100
+        
+        results = []
+        for row_indices, row_similarities in zip(indices, similarities):
+            matches = []
+            for row, similarity in zip(row_indices, row_similarities):
+                similarity = float(similarity)
+                if row >= 0 and similarity > MATCH_THRESHOLD:
+                    matches.append((gallery.names[row], similarity, gallery.member_ids[row]))
+                else:
+                    matches.append((None, max(similarity, 0), None))
+            results.append(matches[0] if top_k == 1 else matches)
+        return results
 
     def get_known_face_by_member_id(self, member_id):
         """Get known face data by member ID"""
-        for face in self.known_faces:
-            if face["member_id"] == member_id:
-                return face
-        return None
+        gallery = self.gallery
+        return gallery.entry_at(gallery.row_for_member(member_id))
+
+    def get_known_face_by_name(self, name):
+        """Get known face data by display name"""
+        gallery = self.gallery
+        return gallery.entry_at(gallery.row_for_name(name))
 
     def is_model_available(self):
         """Check if face recognition model is available"""
         return self.face_model is not None
+
+
+class _PooledEnrollment:
+    """Runs load_known_faces inference on an EnrollmentPool when one is configured
+
+    Cache lookups, validation and thumbnails stay on the loading thread; only
+    embedding extraction goes to the workers. Each worker loads its own
+    model, so the pool is only started once enrollment_pool_min_avatars
+    cache misses have been embedded in-process (a refresh that changes a
+    few avatars never starts it), and it is shut down when the load ends.
+    If it cannot start or breaks, the remaining avatars are embedded
+    in-process with the manager's own model.
+    """
+
+    def __init__(self, manager, embedding_cache, known_faces, previous_faces=None):
+        self.manager = manager
+        self.embedding_cache = embedding_cache
+        self.known_faces = known_faces
+        self.previous_faces = previous_faces
+        self.workers = resolve_worker_count(manager.config.get("enrollment_workers", 0))
+        self.enabled = self.workers > 0
+        self.min_avatars = int(manager.config.get("enrollment_pool_min_avatars", 16))
+        self.misses = 0
+        self.pool = None
+        self.pending = {}
+
+    def add(self, student):
+        known_face, job = self.manager._prepare_enrollment(student, self.embedding_cache, self.previous_faces)
+        if known_face is not None:
+            self.known_faces.append(known_face)
+        if job is None:
+            return
+        
+        self.misses += 1
+        if self.pool is None and self.enabled and self.misses > self.min_avatars:
+            self.pool = EnrollmentPool(self.manager.model_name, self.workers)
+            if not self.pool.start():
+                self.pool = None
+                self.enabled = False
+        
+        if self.pool is None:
+            self._run_in_process(job)
+            return
+        
+        try:
+            self.pending[self.pool.submit(job["name"], job["img_array"])] = job
+        except (BrokenProcessPool, RuntimeError) as e:
+            self._fall_back(e)
+            self._run_in_process(job)
+            return
+        
+        while len(self.pending) >= self.pool.max_pending:
+            self._collect(EnrollmentPool.wait_any(list(self.pending)))
+            if self.pool is None:
+                break
+
+    def finish(self):
+        """Wait for every submitted avatar"""
+        while self.pending:
+            if self.pool is None:
+                for job in list(self.pending.values()):
+                    self._run_in_process(job)
+                self.pending.clear()
+                break
+            self._collect(EnrollmentPool.wait_any(list(self.pending)))
+
+    def close(self):
+        """Drop unfinished work and stop the workers, releasing their models"""
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+        self.pending.clear()
+
+    def _collect(self, done):
+        for future in done:
+            job = self.pending.pop(future)
+            try:
+                embeddings = future.result()
+            except BrokenProcessPool as e:
+                self._fall_back(e)
+                self._run_in_process(job)
+                continue
+            except Exception as e:
+                print(f"❌ Error processing image for {job['name']}: {e}")
+                continue
+            self._append(self.manager._finish_enrollment(job, embeddings, self.embedding_cache))
+
+    def _run_in_process(self, job):
+        try:
+            embeddings = self.manager._extract_embeddings(job["name"], job["img_array"])
+        except Exception as e:
+            print(f"❌ Error processing image for {job['name']}: {e}")
+            return
+        self._append(self.manager._finish_enrollment(job, embeddings, self.embedding_cache))
+
+    def _append(self, known_face):
+        if known_face is not None:
+            self.known_faces.append(known_face)
+
+    def _fall_back(self, error):
+        if self.pool is None:
+            return
+        print(f"Enrollment pool failed, continuing in a single process: {error}")
+        self.pool.shutdown()
+        self.pool = None
+        self.enabled = False
@@ -0,0 +1,276 @@
+"""
+Face Tracker
+ติดตามใบหน้าระหว่างเฟรมด้วย IoU / centroid และ Kalman filter เพื่อไม่ต้องสกัด embedding ใบหน้าเดิมซ้ำทุกเฟรม
+
+Boxes are (x1, y1, x2, y2) in frame pixels. Each track smooths its box
+with a constant-velocity Kalman filter and votes on its identity over the
+matches of its embeddings. Once the vote is decided the track is committed
+and only embedded again every verify_interval seconds, so an identity swap
+between two faces that crossed paths is caught; a verification match for
+another member reopens the vote. Undecided tracks keep being embedded.
+"""
+
+import itertools
+import numpy as np
+
+
+def box_iou(boxes_a, boxes_b):
+    """(A, B) IoU matrix of two (N, 4) box arrays"""
+    boxes_a = np.asarray(boxes_a, dtype=np.float32).reshape(-1, 4)
+    boxes_b = np.asarray(boxes_b, dtype=np.float32).reshape(-1, 4)
+    top_left = np.maximum(boxes_a[:, None, :2], boxes_b[None, :, :2])
+    bottom_right = np.minimum(boxes_a[:, None, 2:], boxes_b[None, :, 2:])
+    intersection = np.prod(np.clip(bottom_right - top_left, 0, None), axis=2)
+    area_a = np.prod(boxes_a[:, 2:] - boxes_a[:, :2], axis=1)
+    area_b = np.prod(boxes_b[:, 2:] - boxes_b[:, :2], axis=1)
+    union = area_a[:, None] + area_b[None, :] - intersection
+    return intersection / np.maximum(union, 1e-6)
+
+
+def predict_bbox(result, now, horizon=0.5):
+    """Box of a face result moved along its track velocity, for drawing between detections
+
+    Extrapolation is capped at horizon seconds so a face that walked out of
+    view does not drift across the frame.
+    """
+    bbox = result["bbox"]
+    velocity = result.get("velocity")
+    if velocity is None:
+        return bbox
+    dt = min(max(now - result.get("timestamp", now), 0.0), horizon)
+    return tuple(int(round(value + speed * dt)) for value, speed in zip(bbox, velocity))
+
+
+class _BoxKalman:
+    """Constant-velocity Kalman filter over a box: state (x1, y1, x2, y2, vx1, vy1, vx2, vy2)"""
+
+    # Noise scales relative to box height, as in SORT/DeepSORT (velocity noise
+    # is larger since detections arrive a few times per second, not every frame)
+    position_noise = 1.0 / 20
+    velocity_noise = 1.0 / 20
+
+    def __init__(self, box):
+        box = np.asarray(box, dtype=np.float64)
+        height = max(box[3] - box[1], 1.0)
+        self.state = np.concatenate([box, np.zeros(4)])
+        std = np.concatenate([np.full(4, 2 * self.position_noise * height),
+                              np.full(4, 10 * self.velocity_noise * height)])
+        self.covariance = np.diag(std ** 2)
+
+    def _transition(self, dt):
+        transition = np.eye(8)
+        transition[:4, 4:] = dt * np.eye(4)
+        return transition
+
+    def predict(self, dt):
+        height = max(self.state[3] - self.state[1], 1.0)
+        transition = self._transition(dt)
+        std = np.concatenate([np.full(4, self.position_noise * height),
+                              np.full(4, self.velocity_noise * height)]) * max(dt, 1e-3)
+        self.state = transition @ self.state
+        self.covariance = transition @ self.covariance @ transition.T + np.diag(std ** 2)
+
+    def update(self, box):
+        height = max(self.state[3] - self.state[1], 1.0)
+        measurement_noise = np.eye(4) * (self.position_noise * height) ** 2
+        projected = self.covariance[:4, :4] + measurement_noise
+        gain = self.covariance[:, :4] @ np.linalg.inv(projected)
+        self.state = self.state + gain @ (np.asarray(box, dtype=np.float64) - self.state[:4])
+        self.covariance = self.covariance - gain @ self.covariance[:4, :]
+
+    def box_at(self, dt):
+        """Box extrapolated dt seconds ahead without changing the filter"""
+        return self.state[:4] + dt * self.state[4:]
+
+    @property
+    def velocity(self):
+        return self.state[4:].copy()
+
+
+class IdentityVote:
+    """Top-k similarity vote over the gallery matches of one track
+
+    Each member keeps its top_k best similarities; the leader is the member
+    with the largest sum of them, and its score is their mean. The vote is
+    committed when the leader holds the majority of at least min_matches
+    matches with a score of accept or more, or at once on a single match of
+    early_accept or more. A committed vote that receives a match for any
+    other member (or for nobody) starts over from that match.
+    """
+
+    def __init__(self, top_k=3, min_matches=2, accept=75, early_accept=85):
+        self.top_k = max(1, int(top_k))
+        self.min_matches = max(1, int(min_matches))
+        self.accept = accept
+        self.early_accept = early_accept
+        self.best = {}  # member_id -> best similarities, descending
+        self.counts = {}
+        self.names = {}
+        self.matches = 0
+        self.committed = False
+
+    @property
+    def leader(self):
+        return max(self.best, key=lambda member_id: sum(self.best[member_id]), default=None)
+
+    @property
+    def score(self):
+        leader = self.leader
+        return float(np.mean(self.best[leader])) if leader is not None else 0.0
+
+    def reset(self):
+        self.best.clear()
+        self.counts.clear()
+        self.names.clear()
+        self.matches = 0
+        self.committed = False
+
+    def add(self, name, similarity, member_id):
+        if self.committed:
+            if member_id == self.leader:
+                self.matches += 1
+                return
+            self.reset()
+        self.matches += 1
+        if member_id is None:
+            return
+        best = self.best.setdefault(member_id, [])
+        best.append(similarity)
+        best.sort(reverse=True)
+        del best[self.top_k:]
+        self.counts[member_id] = self.counts.get(member_id, 0) + 1
+        self.names[member_id] = name
+
+        leader = self.leader
+        if leader == member_id and similarity >= self.early_accept:
+            self.committed = True
+            return
+        votes = self.counts[leader]
+        if (votes >= self.min_matches and 2 * votes > sum(self.counts.values())
+                and self.score >= self.accept):
+            self.committed = True
+
+
+class FaceTrack:
+    """One face followed across detections"""
+
+    def __init__(self, track_id, box, timestamp, vote=None):
+        self.track_id = track_id
+        self.kalman = _BoxKalman(box)
+        self.last_seen = timestamp
+        self.hits = 1
+
+        # Identity voted over the embeddings of this track
+        self.vote = vote if vote is not None else IdentityVote()
+        self.embedded_at = None
+
+    @property
+    def box(self):
+        return self.kalman.state[:4].copy()
+
+    @property
+    def velocity(self):
+        return self.kalman.velocity
+
+    def predicted_box(self, timestamp):
+        return self.kalman.box_at(timestamp - self.last_seen)
+
+    def update(self, box, timestamp):
+        self.kalman.predict(timestamp - self.last_seen)
+        self.kalman.update(box)
+        self.last_seen = timestamp
+        self.hits += 1
+
+    @property
+    def member_id(self):
+        return self.vote.leader
+
+    @property
+    def name(self):
+        return self.vote.names.get(self.vote.leader)
+
+    @property
+    def similarity(self):
+        return self.vote.score
+
+    @property
+    def committed(self):
+        return self.vote.committed
+
+    def add_match(self, name, similarity, member_id, timestamp):
+        """Count the gallery match of a fresh embedding towards the vote"""
+        self.vote.add(name, similarity, member_id)
+        self.embedded_at = timestamp
+
+    def needs_embedding(self, timestamp, reembed_interval, verify_interval=0):
+        """Committed tracks every verify_interval (never if 0); undecided ones every frame
+        until top_k matches, then every reembed_interval"""
+        if self.committed:
+            return verify_interval > 0 and timestamp - self.embedded_at >= verify_interval
+        if self.embedded_at is None or self.vote.matches < self.vote.top_k:
+            return True
+        return timestamp - self.embedded_at >= reembed_interval
+
+
+class FaceTracker:
+    """Greedy IoU association with a centroid fallback, Kalman-smoothed boxes"""
+
+    def __init__(self, iou_threshold=0.3, centroid_threshold=1.0, max_age=1.5, vote_kwargs=None):
+        self.iou_threshold = iou_threshold
+        # Centroid distance as a fraction of the track's box diagonal
+        self.centroid_threshold = centroid_threshold
+        self.max_age = max_age
+        # IdentityVote settings of new tracks
+        self.vote_kwargs = dict(vote_kwargs or {})
+        self.tracks = []
+        self._ids = itertools.count(1)
+
+    def update(self, boxes, timestamp):
+        """Associate this frame's detections with tracks; returns one FaceTrack per box"""
+        boxes = [np.asarray(box, dtype=np.float64)[:4] for box in boxes]
+        self.tracks = [track for track in self.tracks if timestamp - track.last_seen <= self.max_age]
+
+        assigned = [None] * len(boxes)
+        if self.tracks and boxes:
+            predicted = np.stack([track.predicted_box(timestamp) for track in self.tracks])
+            detections = np.stack(boxes)
+            free_tracks = set(range(len(self.tracks)))
+
+            # IoU first, best pairs first
+            iou = box_iou(predicted, detections)
+            for track_index, box_index in zip(*np.unravel_index(np.argsort(-iou, axis=None), iou.shape)):
+                if iou[track_index, box_index] < self.iou_threshold:
+                    break
+                if track_index in free_tracks and assigned[box_index] is None:
+                    assigned[box_index] = track_index
+                    free_tracks.discard(track_index)
+
+            # Centroid distance for fast movers that no longer overlap their prediction
+            for box_index, box in enumerate(boxes):
+                if assigned[box_index] is not None or not free_tracks:
+                    continue
+                centre = (box[:2] + box[2:]) / 2
+                best, best_distance = None, self.centroid_threshold
+                for track_index in free_tracks:
+                    track_box = predicted[track_index]
+                    diagonal = max(np.linalg.norm(track_box[2:] - track_box[:2]), 1.0)
+                    distance = np.linalg.norm(centre - (track_box[:2] + track_box[2:]) / 2) / diagonal
+                    if distance < best_distance:
+                        best, best_distance = track_index, distance
+                if best is not None:
+                    assigned[box_index] = best
+                    free_tracks.discard(best)
+
+        result = []
+        for box_index, box in enumerate(boxes):
+            if assigned[box_index] is None:
+                track = FaceTrack(next(self._ids), box, timestamp, IdentityVote(**self.vote_kwargs))
+                self.tracks.append(track)
+            else:
+                track = self.tracks[assigned[box_index]]
+                track.update(box, timestamp)
+            result.append(track)
+        return result
+
+    def reset(self):
+        self.tracks = []
@@ -0,0 +1,282 @@
+"""
+Face Gallery
+เก็บ embedding ของใบหน้าที่รู้จักเป็น matrix เดียวสำหรับการเปรียบเทียบแบบ vectorized
+"""
+
+import numpy as np
+
+
+EMBEDDING_DIM = 512
+
+# In-memory gallery precisions: bytes per embedding value 4 / 2 / 1. Reduced
+# precision only saves memory: numpy has no float16 BLAS kernel, so float16
+# rows are widened to float32 to be scored and match slower than float32
+STORAGE_DTYPES = ("float32", "float16", "int8")
+
+# Rows of reduced-precision codes widened per block while scoring (~2 MB of float32)
+SCORE_CHUNK_ROWS = 1024
+
+
+def normalize_embeddings(embeddings):
+    """L2-normalize embeddings row-wise (accepts a single vector or a matrix)"""
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return embeddings / norms
+
+
+def quantize_embeddings(embeddings, storage_dtype="float32"):
+    """Encode normalized float32 rows for storage; returns (codes, scales)
+
+    int8 uses symmetric per-row scales (row max maps to 127); scales is
+    None for the float types.
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    if storage_dtype == "int8":
+        scales = np.abs(embeddings).max(axis=-1) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.rint(embeddings / scales[..., None]).astype(np.int8)
+        return codes, scales.astype(np.float32)
+    return embeddings.astype(storage_dtype, copy=False), None
+
+
+def decode_embeddings(codes, scales=None):
+    """float32 rows of stored codes (no copy for float32 storage)"""
+    embeddings = np.asarray(codes).astype(np.float32, copy=False)
+    if scales is not None:
+        embeddings = embeddings * scales[..., None]
+    return embeddings
+
+
+def score_codes(probes, codes, scales=None):
+    """(N, rows) cosine scores of normalized float32 probes against stored codes
+
+    float32 is a single matrix product. Reduced-precision codes are widened
+    one cache-sized block at a time, and the int8 per-row scale is applied
+    to the scores instead of the rows, so a dequantized gallery is never
+    materialized. The widening costs time: float16 scores several times
+    slower than float32 (a native float16 matmul is slower still), int8
+    about as fast.
+    """
+    if codes.dtype == np.float32:
+        return probes @ codes.T
+
+    scores = np.empty((len(probes), len(codes)), dtype=np.float32)
+    for start in range(0, len(codes), SCORE_CHUNK_ROWS):
+        block = codes[start:start + SCORE_CHUNK_ROWS].astype(np.float32)
+        np.matmul(probes, block.T, out=scores[:, start:start + len(block)])
+    if scales is not None:
+        scores *= scales
+    return scores
+
+
+def member_embeddings(known_face):
+    """(K, 512) float32 embedding set of a known_faces entry"""
+    embeddings = known_face.get("embeddings")
+    if embeddings is None:
+        embeddings = known_face["embedding"]
+    embeddings = np.asarray(embeddings)
+    embeddings = embeddings.reshape(-1, embeddings.shape[-1])
+    return decode_embeddings(embeddings, known_face.get("embedding_scales"))
+
+
+class FaceGallery:
+    """Immutable, versioned snapshot of the known faces
+
+    Holds a pre-normalized, contiguous float32 embedding matrix with the
+    matching names, member_ids, thumbnails and known_faces entries, plus the
+    search index built over it. Loaders build a new snapshot and publish it
+    with a single reference assignment; matchers read the reference once per
+    frame, so they never see a half-built gallery and never need a lock.
+    A published snapshot must not be modified.
+
+    A member may own several embeddings (avatar, flipped avatar, confirmed
+    live captures). They are stored in one contiguous ``embeddings`` matrix,
+    grouped by member, with ``segment_starts[i]`` the first row of member i.
+    ``matrix`` has one row per member: the normalized mean of its set (the
+    prototype). With ``aggregation="max"`` exact matching scores every
+    embedding and reduces each member's segment to its best score; with
+    ``"prototype"`` it scores ``matrix`` only. The IVF index always
+    partitions the prototypes.
+
+    ``storage_dtype`` "float16" or "int8" keeps both matrices in reduced
+    precision (``matrix_scales`` / ``embedding_scales`` hold the int8 row
+    scales). The entries' "embedding"/"embeddings" are rebound to views of
+    the stored rows, so the float32 vectors produced by enrollment are not
+    kept alongside them; use member_embeddings() to read a set back.
+    """
+
+    AGGREGATIONS = ("max", "prototype")
+
+    def __init__(self, matrix, names, member_ids, entries=(), version=0,
+                 embeddings=None, segment_starts=None, aggregation="max",
+                 storage_dtype="float32"):
+        if storage_dtype not in STORAGE_DTYPES:
+            print(f"Unsupported gallery storage dtype '{storage_dtype}', using float32")
+            storage_dtype = "float32"
+        self.storage_dtype = storage_dtype
+        self.matrix, self.matrix_scales = self._store(matrix)
+        if embeddings is None or segment_starts is None or len(embeddings) == len(matrix):
+            # One embedding per member: the set matrix is the member matrix
+            self.embeddings, self.embedding_scales = self.matrix, self.matrix_scales
+            self.segment_starts = np.arange(len(matrix), dtype=np.int64)
+        else:
+            self.embeddings, self.embedding_scales = self._store(embeddings)
+            self.segment_starts = np.asarray(segment_starts, dtype=np.int64)
+        if aggregation not in self.AGGREGATIONS:
+            print(f"Unknown match aggregation '{aggregation}', using max")
+            aggregation = "max"
+        self.aggregation = aggregation
+        self.names = tuple(names)
+        self.member_ids = tuple(member_ids)
+        self.entries = self._bind_entries(entries)
+        self.thumbnails = tuple(entry.get("avatar_image") for entry in self.entries)
+        self.version = version
+        # O(1) lookups for attendance bookkeeping; first row wins on duplicates,
+        # matching the old linear scan over known_faces
+        self.member_rows = {}
+        self.name_rows = {}
+        for row, (member_id, name) in enumerate(zip(self.member_ids, self.names)):
+            self.member_rows.setdefault(member_id, row)
+            self.name_rows.setdefault(name, row)
+        # Search index over this snapshot, attached before publishing
+        self.index = None
+
+    def _store(self, matrix):
+        """Encode normalized rows in the storage dtype; returns read-only (codes, scales)"""
+        if np.asarray(matrix).dtype == np.dtype(self.storage_dtype) and self.storage_dtype != "int8":
+            # Already stored in this precision (e.g. a mapped float16 gallery file)
+            codes, scales = np.ascontiguousarray(matrix), None
+        else:
+            codes, scales = quantize_embeddings(matrix, self.storage_dtype)
+            codes = np.ascontiguousarray(codes)
+        for array in (codes, scales):
+            if array is not None and array.flags.writeable:
+                array.setflags(write=False)
+        return codes, scales
+
+    def _bind_entries(self, entries):
+        """Point each entry's embeddings at its rows of the stored set matrix"""
+        if len(entries) != len(self.segment_starts):
+            return tuple(entries)
+        ends = list(self.segment_starts[1:]) + [len(self.embeddings)]
+        bound = []
+        for entry, start, end in zip(entries, self.segment_starts, ends):
+            embeddings = self.embeddings[start:end]
+            scales = self.embedding_scales[start:end] if self.embedding_scales is not None else None
+            bound.append(dict(entry, embedding=embeddings[0], embeddings=embeddings,
+                              embedding_scales=scales))
+        return tuple(bound)
+
+    @property
+    def nbytes(self):
+        """Bytes held by the embedding matrices and scales"""
+        arrays = [self.matrix, self.matrix_scales]
+        if self.has_sets:
+            arrays += [self.embeddings, self.embedding_scales]
+        return sum(array.nbytes for array in arrays if array is not None)
+
+    def decoded_rows(self, rows=None):
+        """float32 copy of prototype rows (all rows by default), e.g. for index training"""
+        if rows is None:
+            rows = slice(None)
+        scales = self.matrix_scales[rows] if self.matrix_scales is not None else None
+        return decode_embeddings(self.matrix[rows], scales)
+
+    @classmethod
+    def empty(cls, dim=EMBEDDING_DIM, version=0):
+        """Create an empty gallery"""
+        return cls(np.zeros((0, dim), dtype=np.float32), [], [], version=version)
+
+    @classmethod
+    def from_segments(cls, embeddings, segment_starts, names, member_ids, entries=(),
+                      version=0, aggregation="max", storage_dtype="float32"):
+        """Build a gallery from grouped embeddings; prototypes are computed here"""
+        embeddings = normalize_embeddings(embeddings)
+        segment_starts = np.asarray(segment_starts, dtype=np.int64)
+        if len(segment_starts) == len(embeddings):
+            matrix = embeddings
+        else:
+            matrix = normalize_embeddings(np.add.reduceat(embeddings, segment_starts, axis=0))
+        return cls(matrix, names, member_ids, entries, version,
+                   embeddings=embeddings, segment_starts=segment_starts,
+                   aggregation=aggregation, storage_dtype=storage_dtype)
+
+    @classmethod
+    def from_known_faces(cls, known_faces, version=0, aggregation="max", storage_dtype="float32"):
+        """Build gallery from the known_faces list produced by load_known_faces
+
+        An entry's "embeddings" (K, 512) holds its whole set; entries with
+        only "embedding" contribute a single row.
+        """
+        if not known_faces:
+            return cls.empty(version=version)
+
+        embedding_sets = [member_embeddings(face) for face in known_faces]
+        counts = np.array([len(embedding_set) for embedding_set in embedding_sets], dtype=np.int64)
+        segment_starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        names = [face["name"] for face in known_faces]
+        # Fall back to name when member_id is missing (same as the old per-face loop)
+        member_ids = [face["member_id"] or face["name"] for face in known_faces]
+        return cls.from_segments(np.concatenate(embedding_sets), segment_starts, names,
+                                 member_ids, known_faces, version, aggregation, storage_dtype)
+
+    def derive(self, version):
+        """New snapshot sharing this one's data but without an index (for re-indexing)"""
+        gallery = FaceGallery.__new__(FaceGallery)
+        gallery.__dict__.update(self.__dict__)
+        gallery.version = version
+        gallery.index = None
+        return gallery
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    def row_for_member(self, member_id):
+        """Gallery row of a member_id, or None"""
+        return self.member_rows.get(member_id)
+
+    def row_for_name(self, name):
+        """Gallery row of a display name, or None"""
+        return self.name_rows.get(name)
+
+    def entry_at(self, row):
+        """known_faces entry of a row, or None (e.g. a gallery loaded from file has no entries)"""
+        if row is None or row >= len(self.entries):
+            return None
+        return self.entries[row]
+
+    @property
+    def has_sets(self):
+        """True when at least one member owns more than one embedding"""
+        return self.embeddings is not self.matrix
+
+    def _member_scores(self, probes):
+        """(N, members) cosine scores of normalized probes under the aggregation mode"""
+        if self.aggregation == "max" and self.has_sets:
+            # Segmented reduction: best embedding of each member's contiguous rows
+            scores = score_codes(probes, self.embeddings, self.embedding_scales)
+            return np.maximum.reduceat(scores, self.segment_starts, axis=1)
+        return score_codes(probes, self.matrix, self.matrix_scales)
+
+    def match_batch(self, face_embeddings, top_k=1):
+        """Match an (N, D) stack of probes with one matrix-matrix product
+
+        Returns (indices, scores), both shaped (N, top_k) and sorted best first.
+        """
+        probes = normalize_embeddings(np.atleast_2d(face_embeddings))
+        num_probes = probes.shape[0]
+        if len(self) == 0 or num_probes == 0:
+            return (np.zeros((num_probes, 0), dtype=np.int64),
+                    np.zeros((num_probes, 0), dtype=np.float32))
+
+        scores = self._member_scores(probes)
+        top_k = max(1, min(top_k, len(self)))
+        if top_k == 1:
+            indices = np.argmax(scores, axis=1)[:, None]
+        else:
+            # argpartition keeps this O(N * M) instead of a full sort per row
+            indices = np.argpartition(-scores, top_k - 1, axis=1)[:, :top_k]
+            order = np.argsort(-np.take_along_axis(scores, indices, axis=1), axis=1)
+            indices = np.take_along_axis(indices, order, axis=1)
+        return indices, np.take_along_axis(scores, indices, axis=1)
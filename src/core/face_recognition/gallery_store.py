@@ -0,0 +1,119 @@
+"""
+Gallery Store
+บันทึก gallery ลงไฟล์ binary และโหลดกลับด้วย memory-map เพื่อเริ่มจดจำใบหน้าได้ทันที
+
+Layout (one set per model name):
+    gallery_<model>.json           manifest: data file, dtype, shape, member_ids, names,
+                                   segment_starts (first row of each member's set)
+    gallery_<model>_<version>.npy  (rows, 512) embedding matrix, grouped by member
+
+Each save writes a new versioned .npy file and then atomically replaces the
+manifest, so processes that still have the previous matrix mapped keep
+reading valid data (and Windows never has to overwrite a mapped file).
+"""
+
+import os
+import glob
+import json
+import time
+import numpy as np
+
+from .gallery import FaceGallery, decode_embeddings
+
+
+SUPPORTED_DTYPES = ("float32", "float16")
+
+
+def _manifest_path(directory, model_name):
+    return os.path.join(directory, f"gallery_{model_name}.json")
+
+
+def save_gallery(gallery, directory, model_name, dtype="float32"):
+    """Persist the gallery matrix and its member index"""
+    if dtype not in SUPPORTED_DTYPES:
+        print(f"Unsupported gallery dtype '{dtype}', using float32")
+        dtype = "float32"
+
+    try:
+        os.makedirs(directory, exist_ok=True)
+        version = int(time.time() * 1000)
+        data_file = f"gallery_{model_name}_{version}.npy"
+
+        embeddings = decode_embeddings(gallery.embeddings, gallery.embedding_scales)
+        np.save(os.path.join(directory, data_file), embeddings.astype(dtype))
+
+        manifest = {
+            "model_name": model_name,
+            "data_file": data_file,
+            "dtype": dtype,
+            "shape": list(gallery.embeddings.shape),
+            "segment_starts": [int(start) for start in gallery.segment_starts],
+            "member_ids": list(gallery.member_ids),
+            "names": list(gallery.names),
+            "saved_at": time.time()
+        }
+        manifest_path = _manifest_path(directory, model_name)
+        temp_path = manifest_path + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        os.replace(temp_path, manifest_path)
+
+        _remove_old_data_files(directory, model_name, keep=data_file)
+        print(f"Saved gallery file: {len(gallery)} faces ({dtype})")
+        return True
+
+    except Exception as e:
+        print(f"Failed to save gallery file: {e}")
+        return False
+
+
+def _remove_old_data_files(directory, model_name, keep):
+    """Delete superseded matrices; files still mapped by another process are left for later"""
+    for path in glob.glob(os.path.join(directory, f"gallery_{model_name}_*.npy")):
+        if os.path.basename(path) == keep:
+            continue
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def load_gallery(directory, model_name, aggregation="max", storage_dtype="float32"):
+    """Memory-map a persisted gallery; returns a FaceGallery or None"""
+    manifest_path = _manifest_path(directory, model_name)
+    if not os.path.exists(manifest_path):
+        return None
+
+    try:
+        start_time = time.time()
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+
+        if manifest.get("model_name") != model_name:
+            print(f"Gallery file model mismatch, ignoring {manifest_path}")
+            return None
+
+        matrix = np.load(os.path.join(directory, manifest["data_file"]), mmap_mode='r')
+        # Files written before embedding sets hold one row per member
+        segment_starts = manifest.get("segment_starts") or list(range(matrix.shape[0]))
+        if (list(matrix.shape) != manifest["shape"]
+                or len(manifest["member_ids"]) != len(segment_starts)):
+            print("Gallery file is inconsistent with its manifest, ignoring")
+            return None
+
+        if len(segment_starts) == matrix.shape[0]:
+            # A file already in the storage dtype stays mapped (shared pages);
+            # anything else is converted into private memory
+            gallery = FaceGallery(matrix, manifest["names"], manifest["member_ids"],
+                                  aggregation=aggregation, storage_dtype=storage_dtype)
+        else:
+            # Prototypes are recomputed, so the sets are read into memory
+            gallery = FaceGallery.from_segments(matrix, segment_starts, manifest["names"],
+                                                manifest["member_ids"], aggregation=aggregation,
+                                                storage_dtype=storage_dtype)
+        print(f"Loaded gallery file: {len(gallery)} faces in {(time.time() - start_time) * 1000:.1f} ms")
+        return gallery
+
+    except Exception as e:
+        print(f"Failed to load gallery file: {e}")
+        return None
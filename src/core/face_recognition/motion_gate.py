@@ -0,0 +1,76 @@
+"""
+Motion Gate
+ตรวจจับการเคลื่อนไหวด้วยการเทียบภาพขาวดำขนาดเล็ก เพื่อข้ามการตรวจจับใบหน้าเมื่อภาพนิ่ง
+
+Each candidate frame is shrunk to width pixels, converted to grayscale,
+blurred and differenced against the previous candidate. When fewer than
+min_area of the pixels changed by more than pixel_threshold the scene is
+static and face detection is skipped. After motion, detection runs at full
+rate for hold_seconds; a static scene is still checked every
+idle_interval seconds so a person standing still is not missed.
+"""
+
+import time
+import cv2
+import numpy as np
+
+
+class MotionGate:
+    """Frame differencing on a downscaled grayscale copy of the frame"""
+
+    def __init__(self, width=80, pixel_threshold=20, min_area=0.005,
+                 hold_seconds=2.0, idle_interval=5.0):
+        self.width = max(16, int(width))
+        self.pixel_threshold = pixel_threshold
+        self.min_area = min_area
+        self.hold_seconds = hold_seconds
+        self.idle_interval = idle_interval
+
+        self.previous = None
+        self.last_motion = None
+        self.last_detect = None
+
+        # Stats
+        self.checked = 0
+        self.skipped = 0
+        self.gate_seconds = 0.0
+
+    def _small_gray(self, frame):
+        height, width = frame.shape[:2]
+        size = (self.width, max(1, int(round(height * self.width / width))))
+        small = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(small, (5, 5), 0)
+
+    def changed_fraction(self, frame):
+        """Fraction of pixels that changed since the previous call (1.0 on the first frame)"""
+        gray = self._small_gray(frame)
+        previous, self.previous = self.previous, gray
+        if previous is None or previous.shape != gray.shape:
+            return 1.0
+        diff = cv2.absdiff(gray, previous)
+        return np.count_nonzero(diff > self.pixel_threshold) / diff.size
+
+    def should_detect(self, frame, now=None):
+        """True if face detection should run on this frame"""
+        start = time.perf_counter()
+        now = time.time() if now is None else now
+        if self.changed_fraction(frame) >= self.min_area:
+            self.last_motion = now
+
+        detect = (self.last_detect is None
+                  or (self.last_motion is not None and now - self.last_motion <= self.hold_seconds)
+                  or now - self.last_detect >= self.idle_interval)
+        if detect:
+            self.last_detect = now
+        else:
+            self.skipped += 1
+        self.checked += 1
+        self.gate_seconds += time.perf_counter() - start
+        return detect
+
+    def reset(self):
+        self.previous = None
+        self.last_motion = None
+        self.last_detect = None
@@ -0,0 +1,164 @@
+"""
+ONNX Session Options
+สร้าง onnxruntime SessionOptions จาก config และโหลด model ของ InsightFace ด้วย session ที่ตั้งค่าเอง
+
+InsightFace's model_zoo.get_model (and so FaceAnalysis) passes only
+providers and provider_options to the InferenceSession; SessionOptions
+given to it are dropped. load_onnx_model goes through ModelRouter, which
+forwards every keyword to the session, and ConfiguredFaceAnalysis builds a
+FaceAnalysis from such models.
+"""
+
+import glob
+import os
+
+try:
+    import onnxruntime
+    ONNXRUNTIME_AVAILABLE = True
+except ImportError:
+    onnxruntime = None
+    ONNXRUNTIME_AVAILABLE = False
+
+try:
+    import onnx
+    from insightface.app import FaceAnalysis
+    from insightface.model_zoo.model_zoo import ModelRouter
+    from insightface.utils import ensure_available
+    INSIGHTFACE_AVAILABLE = True
+except ImportError:
+    FaceAnalysis = object
+    INSIGHTFACE_AVAILABLE = False
+
+
+# Config value -> onnxruntime.GraphOptimizationLevel member
+GRAPH_OPTIMIZATION_LEVELS = {
+    "disable": "ORT_DISABLE_ALL",
+    "basic": "ORT_ENABLE_BASIC",
+    "extended": "ORT_ENABLE_EXTENDED",
+    "all": "ORT_ENABLE_ALL",
+}
+
+EXECUTION_MODES = {
+    "sequential": "ORT_SEQUENTIAL",
+    "parallel": "ORT_PARALLEL",
+}
+
+
+def build_session_options(config, intra_op_threads=None):
+    """SessionOptions from the face_recognition config, or None without onnxruntime
+
+    intra_op_threads overrides onnx_intra_op_threads (enrollment workers
+    split the cores between them). Thread counts of 0 keep onnxruntime's
+    own default.
+    """
+    if not ONNXRUNTIME_AVAILABLE:
+        return None
+
+    session_options = onnxruntime.SessionOptions()
+
+    if intra_op_threads is None:
+        intra_op_threads = config.get("onnx_intra_op_threads", 0)
+    if intra_op_threads:
+        session_options.intra_op_num_threads = int(intra_op_threads)
+    inter_op_threads = config.get("onnx_inter_op_threads", 0)
+    if inter_op_threads:
+        session_options.inter_op_num_threads = int(inter_op_threads)
+
+    level = config.get("onnx_graph_optimization", "all")
+    if level not in GRAPH_OPTIMIZATION_LEVELS:
+        print(f"Unknown ONNX graph optimization level '{level}', using all")
+        level = "all"
+    session_options.graph_optimization_level = getattr(
+        onnxruntime.GraphOptimizationLevel, GRAPH_OPTIMIZATION_LEVELS[level])
+
+    mode = config.get("onnx_execution_mode", "sequential")
+    if mode not in EXECUTION_MODES:
+        print(f"Unknown ONNX execution mode '{mode}', using sequential")
+        mode = "sequential"
+    session_options.execution_mode = getattr(onnxruntime.ExecutionMode, EXECUTION_MODES[mode])
+
+    session_options.enable_cpu_mem_arena = bool(config.get("onnx_enable_cpu_mem_arena", True))
+    session_options.enable_mem_pattern = bool(config.get("onnx_enable_mem_pattern", True))
+    return session_options
+
+
+def _dims(value):
+    return [dim.dim_value or dim.dim_param for dim in value.type.tensor_type.shape.dim]
+
+
+def model_task(onnx_file):
+    """InsightFace taskname of an .onnx file from its graph, without creating a session
+
+    Mirrors ModelRouter.get_model and the model classes' own tasknames
+    ("detection", "recognition", "landmark_2d_106", "landmark_3d_68",
+    "genderage", "attribute_N"), so unused heads can be skipped before
+    onnxruntime loads and optimizes them. None for files FaceAnalysis
+    cannot use (including the face swapper).
+    """
+    graph = onnx.load(onnx_file, load_external_data=False).graph
+    initializers = {initializer.name for initializer in graph.initializer}
+    inputs = [value for value in graph.input if value.name not in initializers]
+    if not inputs:
+        return None
+    shape = _dims(inputs[0])
+    if len(graph.output) >= 5:
+        return "detection"
+    if len(shape) < 4:
+        return None
+    output_shape = _dims(graph.output[0])
+    outputs = output_shape[1] if len(output_shape) > 1 and isinstance(output_shape[1], int) else None
+    if shape[2] == 192 and shape[3] == 192:
+        if outputs == 3309:
+            return "landmark_3d_68"
+        return f"landmark_2d_{outputs // 2}" if outputs else None
+    if shape[2] == 96 and shape[3] == 96:
+        if outputs == 3:
+            return "genderage"
+        return f"attribute_{outputs}" if outputs else None
+    if len(inputs) == 2 and shape[2] == 128 and shape[3] == 128:
+        return None
+    if isinstance(shape[2], int) and shape[2] == shape[3] and shape[2] >= 112 and shape[2] % 16 == 0:
+        return "recognition"
+    return None
+
+
+def load_onnx_model(onnx_file, session_options=None, providers=None):
+    """InsightFace model of one .onnx file on a session built with session_options"""
+    session_kwargs = {"providers": providers or ['CPUExecutionProvider']}
+    if session_options is not None:
+        session_kwargs["sess_options"] = session_options
+    return ModelRouter(onnx_file).get_model(**session_kwargs)
+
+
+class ConfiguredFaceAnalysis(FaceAnalysis):
+    """FaceAnalysis whose sessions use the given SessionOptions
+
+    Only the allowed_modules (InsightFace tasknames, see model_task) get a
+    session at all, and names the pack has no model for are reported;
+    prepare and get are FaceAnalysis' own.
+    """
+
+    def __init__(self, name, root='~/.insightface', allowed_modules=None,
+                 session_options=None, providers=None):
+        onnxruntime.set_default_logger_severity(3)
+        self.models = {}
+        self.model_dir = ensure_available('models', name, root=root)
+        tasks = []
+        for onnx_file in sorted(glob.glob(os.path.join(self.model_dir, '*.onnx'))):
+            task = model_task(onnx_file)
+            tasks.append(task)
+            if task is None or task in self.models:
+                continue
+            if allowed_modules is not None and task not in allowed_modules:
+                continue
+            model = load_onnx_model(onnx_file, session_options, providers)
+            if model is None:
+                print(f"Model not recognized: {onnx_file}")
+                continue
+            self.models[model.taskname] = model
+        unknown = [module for module in allowed_modules or () if module not in tasks]
+        if unknown:
+            print(f"model_modules not found in {name}: {unknown} (available: {[t for t in tasks if t]})")
+        if 'detection' not in self.models:
+            raise RuntimeError(f"No detection model in {self.model_dir}")
+        self.det_model = self.models['detection']
@@ -0,0 +1,118 @@
+"""
+Detection Rate Controller
+ปรับอัตราการตรวจจับใบหน้าต่อวินาทีตามเวลาประมวลผลจริง คิวที่ค้าง และจำนวนใบหน้าที่กำลังติดตาม
+
+The processing thread reports how long each frame took (detection plus
+recognition). The target rate keeps that thread busy for at most
+target_utilization of the time: target = target_utilization / latency.
+The rate climbs towards the target by at most increase_step per processed
+frame and drops to it at once. A frame that is due while the previous one
+is still queued means the host fell behind, so the rate is cut by
+busy_backoff. Without faces waiting for an identity the rate is capped at
+idle_max_rate. Everything stays within [min_rate, max_rate].
+"""
+
+import collections
+import threading
+
+
+class DetectionRateController:
+    """Feedback controller for detections per second"""
+
+    def __init__(self, min_rate=1.0, max_rate=15.0, idle_max_rate=5.0, target_utilization=0.8,
+                 initial_rate=3.0, increase_step=0.5, busy_backoff=0.8):
+        self.min_rate = max(0.1, float(min_rate))
+        self.max_rate = max(self.min_rate, float(max_rate))
+        self.idle_max_rate = min(max(self.min_rate, float(idle_max_rate)), self.max_rate)
+        self.target_utilization = min(max(float(target_utilization), 0.05), 1.0)
+        self.increase_step = increase_step
+        self.busy_backoff = busy_backoff
+        self.rate = self._clamp(initial_rate, self.max_rate)
+        self.lock = threading.Lock()
+
+        self.latency = 0.0  # seconds per processed frame, running mean
+        self.samples = 0
+        self.active_faces = 0
+        self.pending_faces = 0
+        self.last_slot = None
+
+        # Stats
+        self.dispatched = 0
+        self.busy_slots = 0
+        self.dispatch_times = collections.deque(maxlen=50)
+
+    def _clamp(self, rate, cap):
+        return min(max(rate, self.min_rate), cap)
+
+    @property
+    def cap(self):
+        """Upper bound for the current scene"""
+        return self.max_rate if self.pending_faces else self.idle_max_rate
+
+    @property
+    def target_rate(self):
+        if not self.samples:
+            return self.rate
+        return self._clamp(self.target_utilization / max(self.latency, 1e-3), self.cap)
+
+    def due(self, now):
+        """True once 1 / rate seconds have passed since the last slot"""
+        return self.last_slot is None or now - self.last_slot >= 1.0 / self.rate
+
+    def start_slot(self, now):
+        # Keep the schedule rather than restarting it at now, so slots that land
+        # on a later UI tick do not lower the rate; resync after a long gap
+        interval = 1.0 / self.rate
+        if self.last_slot is not None and now - self.last_slot < 2 * interval:
+            self.last_slot += interval
+        else:
+            self.last_slot = now
+
+    def record_dispatch(self, now):
+        self.dispatched += 1
+        self.dispatch_times.append(now)
+
+    def record_busy(self):
+        """The previous frame was still queued when the next one was due"""
+        with self.lock:
+            self.busy_slots += 1
+            self.rate = self._clamp(self.rate * self.busy_backoff, self.cap)
+
+    def record_frame(self, seconds, faces=0, pending_faces=0):
+        """Processing time of one frame and the faces found in it"""
+        with self.lock:
+            self.samples += 1
+            # Running mean over the first frames, then an exponential average
+            weight = max(1.0 / self.samples, 0.1)
+            self.latency += (seconds - self.latency) * weight
+            self.active_faces = faces
+            self.pending_faces = pending_faces
+
+            target = self.target_rate
+            if target > self.rate:
+                self.rate = min(target, self.rate + self.increase_step)
+            else:
+                self.rate = target
+
+    @property
+    def measured_rate(self):
+        """Detections per second actually dispatched over the recent frames"""
+        times = self.dispatch_times
+        if len(times) < 2 or times[-1] <= times[0]:
+            return 0.0
+        return (len(times) - 1) / (times[-1] - times[0])
+
+    def metrics(self):
+        return {
+            "rate": self.rate,
+            "target_rate": self.target_rate,
+            "measured_rate": self.measured_rate,
+            "latency_ms": self.latency * 1000,
+            "utilization": self.rate * self.latency,
+            "active_faces": self.active_faces,
+            "pending_faces": self.pending_faces,
+            "dispatched_frames": self.dispatched,
+            "busy_slots": self.busy_slots,
+            "min_rate": self.min_rate,
+            "max_rate": self.max_rate
+        }
@@ -1,3 +1,4 @@
+import multiprocessing
 import tkinter as tk
 from ui.main_window import MainWindow
 from ui.pages import ModernLoginPage, CameraSelectPage
@@ -60,4 +61,6 @@ def main():
 
 
 if __name__ == "__main__":
+    # Required for enrollment worker processes in the PyInstaller build
+    multiprocessing.freeze_support()
     main()
\ No newline at end of file
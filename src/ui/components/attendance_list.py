@@ -36,6 +36,9 @@ class AttendanceList(ctk.CTkFrame):
             member = attendance_data.get("member_id", "Unknown")
             original_image = attendance_data.get("original_image", Image.new("RGB", (100, 150), "white"))
             capture_image = attendance_data.get("capture_image", Image.new("RGB", (100, 150), "white"))
+            # Gallery avatars are stored as encoded thumbnails; decode only for display
+            if hasattr(original_image, "to_image"):
+                original_image = original_image.to_image()
 
             # สร้าง container สำหรับรายการ
            
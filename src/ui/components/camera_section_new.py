@@ -19,6 +19,7 @@ if utils_path not in sys.path:
 from core.camera.camera_handler import CameraHandler
 from core.face_recognition.face_manager import FaceRecognitionManager
 from core.api.api_client import APIClient
+from core.api.roster_pipeline import RosterPipeline
 from core.attendance.attendance_manager import AttendanceManager
 from ui.components.camera_ui import CameraUI
 from ui.components.progress_dialog import LoadingManager
@@ -64,13 +65,13 @@ class CameraSection(ctk.CTkFrame):
         self.attendance_queue = queue.Queue(maxsize=10)
         
         # Frame processing variables
-        self.frame_count = 0
         self.last_face_results = []
         
         # Initialize modules
         self.api_client = APIClient(access_token, self.api_url)
         self.camera_handler = CameraHandler(self.rtsp_url, self.frame_queue)
         self.face_manager = FaceRecognitionManager(self.face_processing_queue, self.face_results_queue)
+        self.face_manager.set_camera(self.camera_name, self.rtsp_url)
         self.attendance_manager = AttendanceManager(
             self.attendance_queue, 
             self.api_client, 
@@ -91,10 +92,12 @@ class CameraSection(ctk.CTkFrame):
             # Create UI components
             self.camera_ui.create_ui_components()
             
-            # Initialize face recognition model
-            if self.face_manager.initialize_model():
-                # Load known faces from API with progress
-                self.load_students_with_progress()
+            # Load the face recognition model in the background; the camera
+            # preview runs meanwhile and recognition starts in on_model_ready
+            self.face_manager.initialize_model_async(
+                lambda success: self.after(0, lambda: self.on_model_ready(success)),
+                load_persisted_gallery=True
+            )
             
             # Initialize camera
             if self.camera_handler.initialize():
@@ -115,37 +118,49 @@ class CameraSection(ctk.CTkFrame):
             traceback.print_exc()
             self.running = False
     
+    def on_model_ready(self, success):
+        """Runs on the Tk thread once background model loading has finished"""
+        if not success:
+            print("Face recognition model unavailable - camera preview only")
+            return
+        
+        # Load known faces from API with progress (the saved gallery, if any,
+        # was already published on the model loading thread)
+        self.load_students_with_progress()
+        
+        if self.running and not self.face_manager.running:
+            self.face_manager.start_processing()
+    
     def load_students_with_progress(self):
         """Load students data with progress dialog"""
         def load_data(progress_callback):
             """Function to load data with progress updates"""
             try:
-                # Fetch students from API
-                students = self.api_client.fetch_students(progress_callback)
-                
-                # Load known faces
+                # Avatars download on a producer thread while faces are enrolled here
+                students = RosterPipeline(self.api_client, progress_callback)
                 known_faces = self.face_manager.load_known_faces(students, progress_callback)
                 
                 return {
-                    'students': students,
+                    'student_count': self.face_manager.roster_size,
                     'known_faces': known_faces
                 }
             except Exception as e:
                 print(f"Error loading students: {e}")
-                return {'students': [], 'known_faces': []}
+                return {'student_count': 0, 'known_faces': []}
         
         def on_load_complete(result):
             """Callback when loading is complete"""
-            students = result.get('students', [])
+            student_count = result.get('student_count', 0)
             known_faces = result.get('known_faces', [])
-            print(f"Loaded {len(students)} students and {len(known_faces)} known faces")
+            print(f"Loaded {student_count} students and {len(known_faces)} known faces")
             
             # Update header with user count
             if hasattr(self, 'header') and self.header:
-                self.header.update_user_count(len(students))
+                self.header.update_user_count(student_count)
             
             # Start face processing after loading is complete
-            if self.face_manager.is_model_available() and len(known_faces) > 0:
+            if (self.face_manager.is_model_available() and len(known_faces) > 0
+                    and not self.face_manager.running):
                 self.face_manager.start_processing()
 
         # Start loading with progress dialog
@@ -168,9 +183,8 @@ class CameraSection(ctk.CTkFrame):
                 text="กำลังรีเฟรชข้อมูล..."
             )
             
-        # Stop current face processing
-        if self.face_manager.is_model_available():
-            self.face_manager.stop_processing()
+        # Face processing keeps running on the current gallery; the refreshed
+        # gallery is swapped in when loading completes
         
         # Reload data with progress
         self.load_students_with_progress()
@@ -257,8 +271,7 @@ class CameraSection(ctk.CTkFrame):
     def _process_frame_for_faces(self, frame):
         """Process frame for face detection"""
         if self.face_manager.is_model_available():
-            self.frame_count += 1
-            if self.face_manager.should_process_frame(self.frame_count):
+            if self.face_manager.should_process_frame(frame):
                 self.face_manager.add_frame_for_processing(frame)
 
     def _check_for_attendance_recording(self, frame):
@@ -271,6 +284,9 @@ class CameraSection(ctk.CTkFrame):
             # Only process recent results
             if current_time - result.get("timestamp", 0) > 3:
                 continue
+            # Tracked faces record only once their identity vote is committed
+            if result.get("confirmed") is False:
+                continue
                 
             member_id = result.get("member_id")
             similarity = result.get("similarity", 0)
@@ -279,9 +295,14 @@ class CameraSection(ctk.CTkFrame):
                 name = result.get("name", "Unknown")
                 bbox = result.get("bbox")
                 
-                self.attendance_manager.record_attendance(
+                recorded = self.attendance_manager.record_attendance(
                     member_id, name, frame, bbox, self.face_manager
                 )
+                
+                # Confident live captures widen the member's embedding set
+                min_similarity = self.face_manager.config.get("live_capture_min_similarity", 0)
+                if recorded and min_similarity and similarity >= min_similarity:
+                    self.face_manager.add_live_embedding(member_id, result.get("embedding"))
 
     def stop(self):
         """Stop the camera section with better cleanup"""
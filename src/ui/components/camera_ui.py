@@ -10,6 +10,8 @@ import requests
 import time
 from io import BytesIO
 
+from core.face_recognition.face_tracker import predict_bbox
+
 
 class CameraUI:
     def __init__(self, parent_frame):
@@ -141,7 +143,8 @@ class CameraUI:
             # Only show recent results
             if current_time - result.get("timestamp", 0) < 3:
                 try:
-                    x, y, w, h = result["bbox"]
+                    # Move tracked boxes along their velocity between detections
+                    x, y, w, h = predict_bbox(result, current_time)
                     name = result.get("name", "Unknown")
                     member_id = result.get("member_id", "")
                     similarity = result.get("similarity", 0)